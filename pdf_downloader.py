@@ -1,19 +1,30 @@
+import asyncio
 import json
 import os
-import time
 from pathlib import Path
 
-import requests
-from urllib.parse import quote
+import httpx
+from urllib.parse import quote, urlsplit
 
 from pdf2image import convert_from_path
 from tqdm import tqdm
 
+from src.models.ocr.OcrCache import file_digest
+from src.utils.page_renderer import render_referenced_pages
+from src.utils.rate_limiter import ProviderRateLimiter
+
 # === Configuration ===
 EMAIL = "YOUR EMAIL"     # Replace with your email (required by Unpaywall)
 INPUT_JSON = "urls.json"            # Path to the input JSON file containing DOIs or URLs
 SAVE_DIR = "src/data/raw_pdfs"      # Directory to save downloaded PDFs
 IMAGE_DIR = "src/data/images"       # Directory to save converted images
+MANIFEST_PATH = os.path.join(SAVE_DIR, ".download_manifest.json")  # pid -> url, sha256 and size of verified PDFs
+MAX_CONCURRENCY = 16                # Papers downloaded at the same time
+PER_HOST_CONCURRENCY = 4            # Requests in flight to any single publisher host
+UNPAYWALL_RPM = 300                 # Unpaywall lookups per minute
+
+_unpaywall_limiter = ProviderRateLimiter("https://api.unpaywall.org", rpm=UNPAYWALL_RPM)
+_host_semaphores = {}
 
 # === Create save directories ===
 os.makedirs(SAVE_DIR, exist_ok=True)
@@ -25,11 +36,13 @@ def extract_doi(url):
     return url.split("doi.org/")[-1].strip()
 
 
-def get_pdf_link_from_unpaywall(doi):
+async def get_pdf_link_from_unpaywall(client, doi):
     """Query Unpaywall API to get the best open-access PDF link for a given DOI"""
     api_url = f"https://api.unpaywall.org/v2/{quote(doi)}?email={EMAIL}"
+    await _unpaywall_limiter.aacquire()
     try:
-        response = requests.get(api_url, timeout=10)
+        async with _host_slot(api_url):
+            response = await client.get(api_url, timeout=10)
         if response.status_code == 200:
             data = response.json()
             best_oa = data.get("best_oa_location")
@@ -40,19 +53,120 @@ def get_pdf_link_from_unpaywall(doi):
     return None
 
 
-def download_pdf(pdf_url, save_path):
+def _host_slot(url):
+    """Semaphore limiting concurrent requests to the host of url."""
+    host = urlsplit(url).netloc
+    if host not in _host_semaphores:
+        _host_semaphores[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+    return _host_semaphores[host]
+
+
+def _validator(headers):
+    """Strong ETag or Last-Modified of a response, usable in If-Range; None if the server sent neither."""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _expected_size(response):
+    """Length the complete file must have, when the response tells."""
+    if response.status_code == 206:
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and response.headers.get('Content-Encoding', 'identity') == 'identity':
+        return int(length)
+    return None
+
+
+def _discard_partial(part_path):
+    for path in (part_path, f"{part_path}.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _load_partial_meta(part_path):
+    """URL and validator of a partial file; a truncated or corrupt record discards the partial file."""
+    meta_path = f"{part_path}.json"
+    if not os.path.exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if isinstance(meta, dict):
+            return meta
+    except ValueError:
+        pass
+    print(f"⚠️ Unreadable resume record {meta_path}, downloading from the start")
+    _discard_partial(part_path)
+    return {}
+
+
+def _save_partial_meta(part_path, meta):
+    meta_path = f"{part_path}.json"
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+async def download_pdf(client, pdf_url, save_path):
+    """
+    Stream pdf_url into save_path + ".part", resuming a partial file with an HTTP Range
+    request, and move it into place only once the whole file is a PDF.
+
+    The URL and validator (ETag / Last-Modified) of a partial file are kept in
+    <part>.json and sent as If-Range, so a changed document is fetched from the start
+    instead of being appended to old bytes. A file whose final size differs from the
+    one the server announced (Content-Range, else Content-Length) is discarded.
+    """
+    part_path = f"{save_path}.part"
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
                           '(KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36',
         }
-        with requests.get(pdf_url, stream=True, headers=headers, timeout=20) as r:
-            print(f"Status: {r.status_code}, Content-Type: {r.headers.get('Content-Type')}")
-            if r.status_code == 200 and 'pdf' in r.headers.get('Content-Type', '').lower():
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                return True
+        meta = _load_partial_meta(part_path)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and (meta.get("url") != pdf_url or not meta.get("validator")):
+            # Partial file from another URL or without a validator: it cannot be resumed safely
+            _discard_partial(part_path)
+            offset = 0
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = meta["validator"]
+        async with _host_slot(pdf_url):
+            async with client.stream("GET", pdf_url, headers=headers, timeout=20) as r:
+                print(f"Status: {r.status_code}, Content-Type: {r.headers.get('Content-Type')}")
+                if r.status_code == 416 and offset:
+                    # Nothing left to fetch if the partial file is as long as the whole document
+                    expected_size = r.headers.get('Content-Range', '').rpartition('/')[2]
+                    if not expected_size.isdigit():
+                        _discard_partial(part_path)
+                        return False
+                    expected_size = int(expected_size)
+                elif r.status_code in (200, 206) and 'pdf' in r.headers.get('Content-Type', '').lower():
+                    expected_size = _expected_size(r)
+                    if r.status_code == 200:
+                        # The server ignored the Range header, or the document changed (If-Range): start over
+                        _discard_partial(part_path)
+                        _save_partial_meta(part_path, {"url": pdf_url, "validator": _validator(r.headers)})
+                    with open(part_path, 'ab' if r.status_code == 206 else 'wb') as f:
+                        async for chunk in r.aiter_bytes(chunk_size=65536):
+                            f.write(chunk)
+                else:
+                    return False
+        if expected_size is not None and os.path.getsize(part_path) != expected_size:
+            print(f"[Download Error] {pdf_url}: size {os.path.getsize(part_path)} does not match {expected_size}")
+            _discard_partial(part_path)
+            return False
+        with open(part_path, 'rb') as f:
+            if f.read(5) != b'%PDF-':
+                _discard_partial(part_path)  # an HTML landing page or a corrupt resume, do not keep it
+                return False
+        os.replace(part_path, save_path)
+        _discard_partial(part_path)
+        return True
     except Exception as e:
         print(f"[Download Error] {pdf_url}: {e}")
     return False
@@ -63,41 +177,107 @@ def is_direct_pdf_url(url):
     return url.lower().endswith(".pdf")
 
 
-def download_all_papers(paper_path):
-    """Main logic: download from direct PDF URLs or via Unpaywall using DOI"""
+def _load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    with open(f"{MANIFEST_PATH}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(f"{MANIFEST_PATH}.tmp", MANIFEST_PATH)
+
+
+def _verified(save_path, entry):
+    """The file on disk is the one recorded in the manifest."""
+    return bool(entry) and os.path.exists(save_path) and os.path.getsize(save_path) == entry.get("size") \
+        and file_digest(save_path) == entry.get("sha256")
+
+
+async def _download_paper(client, pid, url, manifest):
+    save_path = os.path.join(SAVE_DIR, f"{pid}.pdf")
+    if _verified(save_path, manifest.get(pid)):
+        return "verified"
+    if os.path.exists(save_path):
+        with open(save_path, 'rb') as f:
+            is_pdf = f.read(5) == b'%PDF-'
+        if is_pdf:
+            # Downloaded before the manifest existed: record it instead of fetching again
+            print(f"{pid}: ✅ Already downloaded.")
+            manifest[pid] = {"url": url, "sha256": file_digest(save_path), "size": os.path.getsize(save_path)}
+            _save_manifest(manifest)
+            return "verified"
+
+    if is_direct_pdf_url(url):
+        print(f"{pid}: 🔗 Direct PDF URL detected, downloading: {url}")
+        pdf_url = url
+    else:
+        doi = extract_doi(url)
+        pdf_url = await get_pdf_link_from_unpaywall(client, doi)
+        if not pdf_url:
+            print(f"{pid}: ⚠️ No open-access PDF found via Unpaywall.")
+            return "missing"
+        print(f"{pid}: 🌐 Downloading via Unpaywall: {pdf_url}")
+
+    if await download_pdf(client, pdf_url, save_path):
+        manifest[pid] = {"url": pdf_url, "sha256": file_digest(save_path), "size": os.path.getsize(save_path)}
+        _save_manifest(manifest)
+        print(f"{pid}: ✅ Downloaded successfully.")
+        return "downloaded"
+    print(f"{pid}: ❌ Failed to download.")
+    return "failed"
+
+
+async def adownload_all_papers(paper_path, max_concurrency=MAX_CONCURRENCY):
+    """
+    Download every paper concurrently over one pooled HTTP client: at most max_concurrency
+    papers in flight, PER_HOST_CONCURRENCY requests per host, Unpaywall lookups within
+    UNPAYWALL_RPM. Papers whose file matches the manifest hash are skipped.
+    """
     with open(paper_path, "r", encoding="utf-8") as f:
         papers = json.load(f)
 
-    for pid, url in tqdm(papers.items(), desc="Downloading papers"):
-        save_path = os.path.join(SAVE_DIR, f"{pid}.pdf")
-        if os.path.exists(save_path):
-            print(f"{pid}: ✅ Already downloaded.")
-            continue
-
-        if is_direct_pdf_url(url):
-            print(f"{pid}: 🔗 Direct PDF URL detected, downloading: {url}")
-            success = download_pdf(url, save_path)
-        else:
-            doi = extract_doi(url)
-            pdf_url = get_pdf_link_from_unpaywall(doi)
-            if pdf_url:
-                print(f"{pid}: 🌐 Downloading via Unpaywall: {pdf_url}")
-                success = download_pdf(pdf_url, save_path)
-            else:
-                print(f"{pid}: ⚠️ No open-access PDF found via Unpaywall.")
-                continue
-
-        if success:
-            print(f"{pid}: ✅ Downloaded successfully.")
-        else:
-            print(f"{pid}: ❌ Failed to download.")
-        time.sleep(1)  # Avoid hitting Unpaywall rate limits
+    manifest = _load_manifest()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    progress_bar = tqdm(total=len(papers), desc="Downloading papers")
+    outcomes = {}
+
+    async with httpx.AsyncClient(follow_redirects=True, http2=_http2_available(),
+                                 limits=httpx.Limits(max_connections=max_concurrency * 2)) as client:
+        async def run_paper(pid, url):
+            async with semaphore:
+                outcome = await _download_paper(client, pid, url, manifest)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            progress_bar.update(1)
+
+        await asyncio.gather(*(run_paper(pid, url) for pid, url in papers.items()))
+    progress_bar.close()
+    print(f"📥 {outcomes.get('downloaded', 0)} downloaded, {outcomes.get('verified', 0)} already verified, "
+          f"{outcomes.get('missing', 0)} without open-access PDF, {outcomes.get('failed', 0)} failed")
+    return outcomes
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def download_all_papers(paper_path):
+    """Main logic: download from direct PDF URLs or via Unpaywall using DOI"""
+    return asyncio.run(adownload_all_papers(paper_path))
 
 
 def convert_pdf_to_images(pdf_dir, output_dir):
     """
     Convert PDFs to images. Each PDF will be saved in the output_dir.
     For example: src/data/images/123456_I001.png
+    Renders every page of every PDF; render_referenced_pages only renders the pages the
+    benchmark uses.
     """
     pdf_dir = Path(pdf_dir)
     output_dir = Path(output_dir)
@@ -119,4 +299,4 @@ def convert_pdf_to_images(pdf_dir, output_dir):
 
 if __name__ == "__main__":
     download_all_papers(INPUT_JSON)
-    convert_pdf_to_images(SAVE_DIR, IMAGE_DIR)
+    render_referenced_pages("benchmarks", SAVE_DIR, IMAGE_DIR)
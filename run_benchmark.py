@@ -1,41 +1,70 @@
+import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.utils.utils import *
 
 
 if __name__ == '__main__':
-    model = ManageModel()
-
-    tasks = [
-        # model.mupdf_llava_local,
-        # model.mistral_llava_local,
-        #
-        model.mupdf_hunyuan,
-        # model.mis_hunyuan,
-        #
-        # model.mupdf_glm,
-        # model.mis_glm,
-        #
-        # model.mis_qwen_coder,
-        # model.mupdf_qwen_coder,
-
-        # model.kimi_latest
-    ]
-    with ThreadPoolExecutor(max_workers=10) as executor:  # Adjustable max_workers
-        futures = {executor.submit(task): task.__name__ for task in tasks}
-
-        for future in as_completed(futures):
-            name = futures[future]
-            try:
-                result = future.result()
-                print(f"[✅] {name} completed")
-            except Exception as e:
-                print(f"[❌ ERROR] {name} failed with error: {e}")
+    parser = argparse.ArgumentParser(description="Run the MicrobeQuest benchmark")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Run only shard i of N (\"i/N\"); results go to a per-node segment")
+    parser.add_argument("--merge-shards", action="store_true",
+                        help="Merge all shard segments into eval_sets/ and evaluate, without running models")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit pending cases through the provider batch API (cheaper, not interactive); "
+                             "models whose provider has none run async as usual")
+    args = parser.parse_args()
+
+    model = ManageModel(shard=args.shard)
+    model.use_batch = args.batch
+
+    if args.merge_shards:
+        model.merge_shards()
+    else:
+        tasks = [
+            # model.mupdf_llava_local,
+            # model.mistral_llava_local,
+            #
+            model.mupdf_hunyuan,
+            # model.mis_hunyuan,
+            #
+            # model.mupdf_glm,
+            # model.mis_glm,
+            #
+            # model.mis_qwen_coder,
+            # model.mupdf_qwen_coder,
+
+            # model.kimi_latest
+        ]
+        # Fill the OCR cache up front so model workers only read text, when a selected
+        # pipeline reads PyMuPDF text at all (add "mistral" for mis_* pipelines)
+        if any(task.__name__.startswith("mupdf") or task.__name__ == "qwen_max" for task in tasks):
+            model.prewarm(engines=("pymupdf",))
+        with ThreadPoolExecutor(max_workers=10) as executor:  # Adjustable max_workers
+            futures = {executor.submit(task): task.__name__ for task in tasks}
+
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                    print(f"[✅] {name} completed")
+                except Exception as e:
+                    print(f"[❌ ERROR] {name} failed with error: {e}")
+
+        # One OCR pass for several IR models, instead of one mupdf_* thread each:
+        # model.fan_out("pymupdf", ["mupdf_hunyuan", "mupdfThudmGlm", "mupdf_qwen_coder"])
+
+        model.report_http_pools()  # peak concurrency and saturation per endpoint
+        model.report_response_cache()
+
+    if args.shard is not None:
+        # Scores are computed once all nodes finished: python run_benchmark.py --merge-shards
+        raise SystemExit(0)
 
     # Evaluation
     model.batch_summarize_eval_sets(
         eval_sets_dir=model.save_path,
         save_path=model.save_path,  # Save it back to the model folder
-        evaluate_results_from_file=evaluate_results_from_file,
+        evaluate_results_from_file=iter_evaluated_results,  # stream records instead of loading whole files
         summarize_results=summarize_results
     )
 
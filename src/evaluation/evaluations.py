@@ -1,62 +1,64 @@
 import re
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 import json  # For reading/writing JSON files
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator
 import csv
 
-def evaluate_results_from_file(input_path: str) -> List[Dict]:
+from src.utils.result_store import iter_result_records
+
+def iter_evaluated_results(input_path: str) -> Iterator[Dict]:
     """
-    Evaluate each record in a JSON file that contains predictions and references,
-    then write the results with evaluation scores to a new file.
-    Also write debug information including tokens to a separate file.
+    Stream the records of a result file (<task>.jsonl or legacy <task>.json)
+    one at a time, each with its 'evaluation' field filled in.
     """
-    # Load original predictions
-    with open(input_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    debug_info = []  # Used for storing debugging information
-
-    # Evaluate each item
-    for item in data:
+    for item in iter_result_records(input_path):
         expected = item.get("expected_answer", "")
         predicted = item.get("predicted_answer", "")
         evaluation, debug_record = evaluate_pair(expected, predicted)
         item["evaluation"] = evaluation
-        debug_info.append(debug_record)
+        yield item
 
-    return data
+
+def evaluate_results_from_file(input_path: str) -> List[Dict]:
+    """
+    Evaluate each record in a result file that contains predictions and references
+    and return the records with their evaluation scores.
+    """
+    return list(iter_evaluated_results(input_path))
 
 
-def summarize_results(results: List[Dict]) -> Dict[str, float]:
+def summarize_results(results: Iterable[Dict]) -> Dict[str, float]:
     """
     Aggregate the evaluation results: compute average accuracy, recall, F1, and BLEU scores.
 
     Args:
-        results: List of evaluation records, each containing an 'evaluation' field.
+        results: Evaluation records (list or stream), each containing an 'evaluation' field.
 
     Returns:
         A dictionary with average values for the main metrics.
     """
-    if not results:
+    total = 0
+    correct = 0
+    total_recall = 0.0
+    total_f1 = 0.0
+    total_bleu = 0.0
+    # Single pass so that a generator from iter_evaluated_results is never materialised
+    for r in results:
+        total += 1
+        if r["evaluation"]["accuracy"] == 1.0:
+            correct += 1
+        total_recall += r["evaluation"]["recall"]
+        total_f1 += r["evaluation"]["f1_score"]
+        total_bleu += r["evaluation"]["bleu_score"]
+
+    if not total:
         print("No results to summarize.")
         return {}
 
-    total = len(results)
-    correct = sum(1 for r in results if r["evaluation"]["accuracy"] == 1.0)
-    overall_accuracy = correct / total if total > 0 else 0.0
-
-    total_recall = sum(r["evaluation"]["recall"] for r in results)
-    total_f1 = sum(r["evaluation"]["f1_score"] for r in results)
-    total_bleu = sum(r["evaluation"]["bleu_score"] for r in results)
-
-    avg_recall = total_recall / total if total > 0 else 0.0
-    avg_f1 = total_f1 / total if total > 0 else 0.0
-    avg_bleu = total_bleu / total if total > 0 else 0.0
-    #
-    # print(f"Overall Accuracy: {overall_accuracy:.2%} ({correct}/{total})")
-    # print(f"Average Recall:   {avg_recall:.4f}")
-    # print(f"Average F1 Score: {avg_f1:.4f}")
-    # print(f"Average BLEU:     {avg_bleu:.4f}")
+    overall_accuracy = correct / total
+    avg_recall = total_recall / total
+    avg_f1 = total_f1 / total
+    avg_bleu = total_bleu / total
 
     return {
         "accuracy": round(overall_accuracy, 4),
@@ -0,0 +1,37 @@
+import os
+from typing import Dict
+
+from src.utils.result_store import ResultStore
+
+
+def cached_token_report(eval_sets_dir: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Prompt tokens served from provider prefix caches, from the usage recorded in each
+    result's token_count, per model and prompt layout.
+
+    Returns:
+        {model: {layout: {"cases", "input_tokens", "cached_tokens", "cached_ratio"}}}
+    """
+    report = {}
+    for model_name in sorted(os.listdir(eval_sets_dir)):
+        model_dir = os.path.join(eval_sets_dir, model_name)
+        if not os.path.isdir(model_dir):
+            continue
+        layouts = {}
+        for data_name in ResultStore.list_tasks(model_dir):
+            for record in ResultStore(model_dir, data_name).iter_records():
+                if record.get("cache_hit"):
+                    continue  # replayed locally, never reached the provider
+                token_count = record.get("token_count") or {}
+                row = layouts.setdefault(record.get("prompt_layout", "question_first"),
+                                         {"cases": 0, "input_tokens": 0, "cached_tokens": 0})
+                row["cases"] += 1
+                row["input_tokens"] += token_count.get("input_tokens", 0)
+                row["cached_tokens"] += token_count.get("cached_tokens", 0)
+        for layout, row in layouts.items():
+            row["cached_ratio"] = round(row["cached_tokens"] / row["input_tokens"], 4) if row["input_tokens"] else 0.0
+            print(f"💾 {model_name} [{layout}]: {row['cached_ratio']:.1%} of {row['input_tokens']} prompt tokens "
+                  f"cached over {row['cases']} cases")
+        if layouts:
+            report[model_name] = layouts
+    return report
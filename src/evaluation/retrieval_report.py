@@ -0,0 +1,108 @@
+import json
+import os
+import re
+from typing import Dict, List
+
+from tqdm import tqdm
+
+from src.models.ocr.OcrCache import file_digest
+from src.models.retrieval.PageRetriever import tokenize
+
+_ANSWER_TAG = re.compile(r"</?\s*Answer\s*>", re.IGNORECASE)
+
+
+def _answer_terms(expected_answer: str) -> List[str]:
+    return tokenize(_ANSWER_TAG.sub(" ", str(expected_answer)))
+
+
+def _term_recall(answer_terms: List[str], context: str) -> float:
+    """Share of the expected answer's terms that occur in the context."""
+    if not answer_terms:
+        return 1.0
+    context_terms = set(tokenize(context))
+    return sum(term in context_terms for term in answer_terms) / len(answer_terms)
+
+
+def retrieval_recall_report(benchmark_folder: str, pdf_root_path: str, ocr_model, retriever,
+                            output_path: str = "retrieval_report.json") -> Dict[str, Dict]:
+    """
+    Estimate, without calling any model, how much answer evidence the retrieval stage drops
+    on full-PDF cases: for every case, the share of expected-answer terms found in the whole
+    OCR text versus in the retrieved passages, plus the prompt tokens saved.
+
+    The gap between "full_recall" and "retrieved_recall" is the recall lost to retrieval;
+    cases whose answer is not in the text at all (e.g. free-form summaries) lower both.
+    Scores of a real run with and without a retriever remain the final check.
+
+    Returns:
+        {task: summary} with an "_overall" entry; also written to output_path as JSON.
+    """
+    per_task = {}
+    for file_name in sorted(f for f in os.listdir(benchmark_folder) if f.endswith(".json")):
+        with open(os.path.join(benchmark_folder, file_name), "r", encoding="utf-8") as f:
+            test_cases = json.load(f)
+        rows = []
+        for case in tqdm(test_cases, desc=f"🔎 Retrieval recall on {file_name}"):
+            case_input = case["test_case"]["input"]
+            if case_input.get("is_full_pdf") not in (True, "true"):
+                continue
+            answer_terms = _answer_terms(case["test_case"]["expected_answer"])
+            full_text, retrieved_text = "", ""
+            document_tokens, selected_tokens = 0, 0
+            for pdf_index in case_input["pdf_index"].split(","):
+                pdf_path = os.path.join(pdf_root_path, f"{pdf_index}.pdf")
+                if not os.path.exists(pdf_path):
+                    continue
+                pages = ocr_model.extract_text(pdf_path, page_numbers=None)
+                engine = getattr(ocr_model, 'engine', getattr(ocr_model, 'ENGINE', type(ocr_model).__name__))
+                document_key = f"{engine}:{file_digest(pdf_path)}"
+                selected, stats = retriever.select(document_key, pages, case["test_case"]["question"])
+                full_text += " ".join(map(str, pages.values()))
+                retrieved_text += " ".join(map(str, selected.values()))
+                document_tokens += stats["document_tokens"]
+                selected_tokens += stats["selected_tokens"]
+            if not full_text:
+                continue
+            full_recall = _term_recall(answer_terms, full_text)
+            retrieved_recall = _term_recall(answer_terms, retrieved_text)
+            rows.append({
+                "full_recall": full_recall,
+                "retrieved_recall": retrieved_recall,
+                "full_hit": full_recall == 1.0,
+                "retrieved_hit": retrieved_recall == 1.0,
+                "document_tokens": document_tokens,
+                "selected_tokens": selected_tokens,
+            })
+        if rows:
+            per_task[file_name[:-len(".json")]] = rows
+
+    report = {task: _summarize(rows) for task, rows in per_task.items()}
+    report["_overall"] = _summarize([row for rows in per_task.values() for row in rows])
+    report["_settings"] = {"token_budget": retriever.token_budget, "passage_tokens": retriever.passage_tokens,
+                           "lead_passages": retriever.lead_passages}
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    overall = report["_overall"]
+    print(f"🔎 Retrieval keeps {overall['retrieved_recall']:.1%} of answer terms vs {overall['full_recall']:.1%} "
+          f"for the full document (loss {overall['recall_loss']:.1%}) using {overall['token_ratio']:.1%} of the tokens")
+    return report
+
+
+def _summarize(rows: List[Dict]) -> Dict[str, float]:
+    n = len(rows)
+    if n == 0:
+        return {"cases": 0, "full_recall": 0.0, "retrieved_recall": 0.0, "recall_loss": 0.0,
+                "full_hit_rate": 0.0, "retrieved_hit_rate": 0.0, "token_ratio": 0.0}
+    full_recall = sum(r["full_recall"] for r in rows) / n
+    retrieved_recall = sum(r["retrieved_recall"] for r in rows) / n
+    document_tokens = sum(r["document_tokens"] for r in rows)
+    return {
+        "cases": n,
+        "full_recall": round(full_recall, 4),
+        "retrieved_recall": round(retrieved_recall, 4),
+        "recall_loss": round(full_recall - retrieved_recall, 4),
+        "full_hit_rate": round(sum(r["full_hit"] for r in rows) / n, 4),
+        "retrieved_hit_rate": round(sum(r["retrieved_hit"] for r in rows) / n, 4),
+        "token_ratio": round(sum(r["selected_tokens"] for r in rows) / document_tokens, 4) if document_tokens else 0.0,
+    }
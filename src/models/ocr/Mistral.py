@@ -1,13 +1,132 @@
 import os
 import base64
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from mistralai import DocumentURLChunk
 from mistralai import Mistral
 
+from src.models.ocr.OcrCache import file_digest
+from src.utils.http_pool import get_http_client
+
+# A dated model id, not the "mistral-ocr-latest" alias: it is the engine version of every
+# cached OCR entry, so moving to a newer model must be an explicit change of this value
+OCR_MODEL = "mistral-ocr-2505"
+
+
+class MistralOcrSession:
+    """
+    One pooled Mistral client per API key that uploads each PDF once, reuses the
+    file id and signed URL until they expire, and runs OCR once per document.
+    Page slices are then served locally from the remembered response.
+    """
+
+    SERVER_URL = "https://api.mistral.ai"
+    SIGNED_URL_HOURS = 24
+    EXPIRY_MARGIN_SECONDS = 600  # re-sign a little before the provider expires the URL
+
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, api_key: str, ocr_model: str = OCR_MODEL, max_documents: int = 32):
+        self.client = Mistral(api_key=api_key, client=get_http_client(self.SERVER_URL, api_key))
+        self.ocr_model = ocr_model
+        self.max_documents = max_documents
+
+        self._uploads = {}  # digest -> (file_id, signed_url, expires_at)
+        self._responses = OrderedDict()  # (digest, include_image_base64) -> OCR response
+        self._lock = threading.Lock()
+        self._doc_locks = {}
+
+    @classmethod
+    def for_key(cls, api_key: str, ocr_model: str = OCR_MODEL) -> "MistralOcrSession":
+        with cls._sessions_lock:
+            key = (api_key, ocr_model)
+            if key not in cls._sessions:
+                cls._sessions[key] = cls(api_key, ocr_model)
+            return cls._sessions[key]
+
+    def _doc_lock(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._doc_locks.setdefault(digest, threading.Lock())
+
+    def signed_url(self, pdf_path: str, digest: str) -> str:
+        """Upload the PDF unless a live upload of the same content is known, return its signed URL."""
+        upload = self._uploads.get(digest)
+        if upload is not None and upload[2] > time.time():
+            return upload[1]
+
+        pdf_file = Path(pdf_path)
+        if upload is None:
+            with open(pdf_file, "rb") as file:
+                uploaded_file = self.client.files.upload(
+                    file={"file_name": pdf_file.name, "content": file.read()},
+                    purpose="ocr",
+                )
+            file_id = uploaded_file.id
+        else:
+            file_id = upload[0]  # file is still stored, only the URL needs re-signing
+
+        signed_url = self.client.files.get_signed_url(file_id=file_id, expiry=self.SIGNED_URL_HOURS)
+        expires_at = time.time() + self.SIGNED_URL_HOURS * 3600 - self.EXPIRY_MARGIN_SECONDS
+        self._uploads[digest] = (file_id, signed_url.url, expires_at)
+        return signed_url.url
+
+    def process(self, pdf_path: str, include_image_base64: bool = False):
+        """
+        OCR response for the whole document, computed at most once per content hash.
+        A response fetched with images also serves text-only requests.
+        """
+        pdf_file = Path(pdf_path)
+        if not pdf_file.is_file():
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        digest = file_digest(pdf_path)
+
+        with self._doc_lock(digest):
+            for key in ((digest, True), (digest, include_image_base64)):
+                if key in self._responses:
+                    with self._lock:
+                        self._responses.move_to_end(key)
+                    return self._responses[key]
+
+            try:
+                response = self.client.ocr.process(
+                    document=DocumentURLChunk(document_url=self.signed_url(pdf_path, digest)),
+                    model=self.ocr_model,
+                    include_image_base64=include_image_base64
+                )
+            except Exception:
+                self._uploads.pop(digest, None)  # the next attempt starts from a fresh upload
+                raise
+
+            with self._lock:
+                self._responses[(digest, include_image_base64)] = response
+                while len(self._responses) > self.max_documents:
+                    self._responses.popitem(last=False)
+            return response
+
+    def pages(self, pdf_path: str) -> dict:
+        """{page.index: markdown} for every page of the document."""
+        return {page.index: page.markdown for page in self.process(pdf_path).pages}
+
 
 class ExtractTextByMistral:
-    def __init__(self, api_key):
+    ENGINE = "mistral"
+    OCR_MODEL = OCR_MODEL
+
+    def __init__(self, api_key, cache=None):
+        """
+        :param api_key: Mistral API key.
+        :param cache: Optional OcrCache; when set, OCR text also survives across runs and machines.
+        """
         self.api_key = api_key
+        self.cache = cache
+        self.session = MistralOcrSession.for_key(api_key, self.OCR_MODEL)
+
+    def process_with_images(self, pdf_path: str):
+        """Full OCR response including image base64 payloads, e.g. for save_ocr_results()."""
+        return self.session.process(pdf_path, include_image_base64=True)
 
     def replace_images_in_markdown(self, markdown_str: str, images_dict: dict) -> str:
         """Replace image paths in Markdown content"""
@@ -41,39 +160,28 @@ class ExtractTextByMistral:
 
         return all_markdowns
 
+    def _extract_all_pages(self, pdf_path: str) -> dict:
+        return self.session.pages(pdf_path)
+
     def extract_text(self, pdf_path: str, page_numbers: list):
         """
         Process the PDF and perform OCR.
         Only return the Markdown content of the first page whose index is in the specified image_index list.
         Note: image_index refers to page indices (page.index), not image IDs.
         """
-        page_numbers=range(len(page_numbers))
+        page_numbers = range(len(page_numbers)) if page_numbers else None
 
-        client = Mistral(api_key=self.api_key)
-        pdf_file = Path(pdf_path)
-        if not pdf_file.is_file():
-            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
-
-        with open(pdf_file, "rb") as file:
-            uploaded_file = client.files.upload(
-                file={"file_name": pdf_file.name, "content": file.read()},
-                purpose="ocr",
+        if self.cache is not None:
+            return self.cache.get_or_extract(
+                pdf_path, self.ENGINE, self.OCR_MODEL,
+                extract_all=lambda: self._extract_all_pages(pdf_path),
+                page_numbers=page_numbers,
             )
 
-        signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=24)
-        pdf_response = client.ocr.process(
-            document=DocumentURLChunk(document_url=signed_url.url),
-            model="mistral-ocr-latest",
-            include_image_base64=True
-        )
-
         # Collect markdowns from all matching pages
         matched_markdowns = {}
-        for page in pdf_response.pages:
-            if page_numbers and page.index not in page_numbers:
+        for page_index, markdown in self._extract_all_pages(pdf_path).items():
+            if page_numbers and page_index not in page_numbers:
                 continue  # Only process specified pages
-            matched_markdowns[page.index] = page.markdown
+            matched_markdowns[page_index] = markdown
         return matched_markdowns  # Return all matched markdowns (could be empty)
-
-
-
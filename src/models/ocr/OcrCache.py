@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+_digests = {}  # (path, size, mtime_ns) -> sha256
+
+
+def file_digest(pdf_path: str) -> str:
+    """SHA-256 of the file content, memoised per (path, size, mtime)."""
+    stat = os.stat(pdf_path)
+    stat_key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(stat_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _digests[stat_key] = digest
+    return digest
+
+
+class OcrCache:
+    """
+    Disk-backed OCR cache keyed by PDF content hash, OCR engine and engine version.
+
+    Each entry holds the per-page text of a whole document:
+        <cache_dir>/<engine>/<engine_version>/<sha256[:2]>/<sha256>.json
+    Keys depend only on file content, never on paths, so one cache directory can be
+    shared by the mupdf_* and mis_* pipelines and copied or mounted across machines.
+    """
+
+    def __init__(self, cache_dir: str = "src/data/ocr_cache", max_memory_entries: int = 64):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()  # (digest, engine, version) -> {page: text}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+
+    def file_digest(self, pdf_path: str) -> str:
+        return file_digest(pdf_path)
+
+    def entry_path(self, digest: str, engine: str, engine_version: str) -> str:
+        return os.path.join(self.cache_dir, self._safe(engine), self._safe(engine_version),
+                            digest[:2], f"{digest}.json")
+
+    @staticmethod
+    def select_pages(pages: Dict[int, str], page_numbers: Optional[Iterable[int]]) -> Dict[int, str]:
+        """Subset of pages in document order; None or empty page_numbers means all pages."""
+        if not page_numbers:
+            return dict(pages)
+        wanted = set(page_numbers)
+        return {page: text for page, text in pages.items() if page in wanted}
+
+    def _remember(self, key, pages: Dict[int, str]) -> None:
+        with self._lock:
+            self._memory[key] = pages
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def load(self, digest: str, engine: str, engine_version: str) -> Optional[Dict[int, str]]:
+        """Return all cached pages of a document, or None on a miss."""
+        key = (digest, engine, engine_version)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self.entry_path(digest, engine, engine_version)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[OCR cache] Ignoring unreadable entry {path}: {e}")
+            return None
+
+        pages = {int(page): text for page, text in entry["pages"].items()}
+        self._remember(key, pages)
+        return pages
+
+    def store(self, digest: str, engine: str, engine_version: str, pages: Dict[int, str],
+              source_name: str = "") -> None:
+        """Write all pages of a document atomically (temp file + os.replace)."""
+        path = self.entry_path(digest, engine, engine_version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "sha256": digest,
+            "engine": engine,
+            "engine_version": engine_version,
+            "source_name": source_name,
+            "pages": {str(page): text for page, text in pages.items()},
+        }
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._remember((digest, engine, engine_version), pages)
+
+    def get_or_extract(self, pdf_path: str, engine: str, engine_version: str,
+                       extract_all: Callable[[], Dict[int, str]],
+                       page_numbers: Optional[Iterable[int]] = None) -> Dict[int, str]:
+        """
+        Return the requested pages of pdf_path, running extract_all() (which must return
+        every page of the document) only when the document is not cached yet. Concurrent
+        callers asking for the same document wait for a single extraction.
+        """
+        digest = self.file_digest(pdf_path)
+        key = (digest, engine, engine_version)
+
+        pages = self.load(*key)
+        if pages is None:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                pages = self.load(*key)
+                if pages is None:
+                    self.misses += 1
+                    pages = extract_all()
+                    self.store(digest, engine, engine_version, pages, source_name=os.path.basename(pdf_path))
+                else:
+                    self.hits += 1
+        else:
+            self.hits += 1
+
+        return self.select_pages(pages, page_numbers)
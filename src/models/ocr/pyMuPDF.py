@@ -1,25 +1,186 @@
-from typing import Dict, List
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional
 import fitz  # PyMuPDF
 
+LAYOUTS = ("text", "blocks", "spans")
+
+
+class _PooledDocument:
+    __slots__ = ("doc", "lock", "users")
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.lock = threading.Lock()  # a fitz.Document is used by one thread at a time
+        self.users = 0  # callers holding it; pinned documents are never closed
+
+
+class DocumentPool:
+    """
+    LRU of open PyMuPDF documents keyed by path and modification time. Opening a PDF
+    parses its xref and page tree, so repeated page lookups on the same paper reuse the
+    handle. Documents beyond max_open are closed once no caller is using them.
+    """
+
+    def __init__(self, max_open: int = 16):
+        self.max_open = max_open
+        self._docs = OrderedDict()  # (path, mtime_ns) -> _PooledDocument
+        self._lock = threading.Lock()
+
+    def _evict(self) -> None:
+        # Called with _lock held; pinned documents stay open until their last user leaves
+        for key in list(self._docs):
+            if len(self._docs) <= self.max_open:
+                break
+            if self._docs[key].users == 0:
+                self._docs.pop(key).doc.close()
+
+    @contextmanager
+    def open(self, pdf_path: str):
+        key = (os.path.abspath(pdf_path), os.stat(pdf_path).st_mtime_ns)
+        with self._lock:
+            entry = self._docs.get(key)
+            if entry is None:
+                entry = _PooledDocument(fitz.open(pdf_path))
+                self._docs[key] = entry
+            else:
+                self._docs.move_to_end(key)
+            entry.users += 1
+            self._evict()
+        try:
+            with entry.lock:
+                yield entry.doc
+        finally:
+            with self._lock:
+                entry.users -= 1
+                self._evict()
+
+    def close(self) -> None:
+        with self._lock:
+            for key in [key for key, entry in self._docs.items() if entry.users == 0]:
+                self._docs.pop(key).doc.close()
+
+
+_pool = DocumentPool()  # one per process, shared by every extractor in it
+
+
+def page_text(page, layout: str = "text") -> str:
+    """
+    Text of one page. "blocks" prefixes every text block with its bounding box,
+    "spans" every span with its bounding box, font and size, for the layout tasks.
+    """
+    if layout == "blocks":
+        lines = []
+        for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", sort=True):
+            if block_type == 0 and text.strip():
+                lines.append(f"[{x0:.0f},{y0:.0f},{x1:.0f},{y1:.0f}] {text.strip()}")
+        return "\n".join(lines)
+    if layout == "spans":
+        lines = []
+        for block in page.get_text("dict", sort=True)["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    if span["text"].strip():
+                        x0, y0, x1, y1 = span["bbox"]
+                        lines.append(f"[{x0:.0f},{y0:.0f},{x1:.0f},{y1:.0f}] ({span['font']} {span['size']:.1f}) "
+                                     f"{span['text'].strip()}")
+        return "\n".join(lines)
+    return page.get_text("text")
+
+
+def _extract_range(pdf_path: str, start: int, stop: int, layout: str) -> Dict[int, str]:
+    # Runs in a worker process for full-document extraction: pages start..stop-1 (0-based)
+    pages = {}
+    with _pool.open(pdf_path) as doc:
+        for index in range(start, min(stop, doc.page_count)):
+            text = page_text(doc.load_page(index), layout)
+            if text.strip():
+                pages[index + 1] = text
+    return pages
+
+
 class ExtractTextByPyMuPDF:
+    ENGINE = "pymupdf"
+    ENGINE_VERSION = getattr(fitz, "VersionBind", "unknown")
 
-    def extract_text(self, pdf_path: str, page_numbers: List[int] = None) -> Dict[int, str]:
+    def __init__(self, cache=None, layout: str = "text", workers: int = 1, parallel_min_pages: int = 32):
         """
-        Extracts text from a PDF using PyMuPDF.
-        :param pdf_path: Path to the PDF file.
-        :param page_numbers: List of page numbers to extract (1-based). If None, extract all pages.
-        :return: Dictionary {page_number: extracted_text}
+        :param cache: Optional OcrCache; when set, each document is parsed once and later
+                      calls are served from the cache.
+        :param layout: "text" (plain text), "blocks" or "spans" (text with positions, for layout tasks).
+        :param workers: Processes used to extract whole documents of at least parallel_min_pages
+                        pages; keep 1 when the caller already runs in a process pool (prewarm).
         """
-        doc = fitz.open(pdf_path)
-        page_numbers = page_numbers if page_numbers is not None else []
+        if layout not in LAYOUTS:
+            raise ValueError(f"layout must be one of {LAYOUTS}, got: {layout}")
+        self.cache = cache
+        self.layout = layout
+        self.workers = workers
+        self.parallel_min_pages = parallel_min_pages
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # Layout output is a different text, so it is cached apart from the plain text
+        self.engine = self.ENGINE if layout == "text" else f"{self.ENGINE}-{layout}"
+
+    def _executor_for_full_documents(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
 
+    def _extract_pages(self, pdf_path: str, page_numbers: List[int] = None, raise_errors: bool = False) -> Dict[int, str]:
         full_text = {}
         try:
-            for page_number, page in enumerate(doc, start=1):
-                if not page_numbers or page_number in page_numbers:
-                    text = page.get_text("text")
-                    if text.strip():
-                        full_text[page_number] = text
+            with _pool.open(pdf_path) as doc:
+                page_count = doc.page_count
+                if page_numbers:
+                    # Jump straight to the requested pages instead of walking the whole document
+                    for page_number in sorted(set(page_numbers)):
+                        if 1 <= page_number <= page_count:
+                            text = page_text(doc.load_page(page_number - 1), self.layout)
+                            if text.strip():
+                                full_text[page_number] = text
+                    return full_text
+                if self.workers <= 1 or page_count < self.parallel_min_pages:
+                    for index in range(page_count):
+                        text = page_text(doc.load_page(index), self.layout)
+                        if text.strip():
+                            full_text[index + 1] = text
+                    return full_text
+
+            # Large document: contiguous page ranges across worker processes
+            step = -(-page_count // self.workers)
+            executor = self._executor_for_full_documents()
+            futures = [executor.submit(_extract_range, pdf_path, start, start + step, self.layout)
+                       for start in range(0, page_count, step)]
+            for future in futures:
+                full_text.update(future.result())
         except Exception as e:
             print(f"PDF extraction failed: {e}")
+            if raise_errors:
+                raise
         return full_text
+
+    def extract_text(self, pdf_path: str, page_numbers: List[int] = None) -> Dict[int, str]:
+        """
+        Extracts text from a PDF using PyMuPDF.
+        :param pdf_path: Path to the PDF file.
+        :param page_numbers: List of page numbers to extract (1-based). If None, extract all pages.
+        :return: Dictionary {page_number: extracted_text}
+        """
+        if self.cache is None:
+            return self._extract_pages(pdf_path, page_numbers)
+        return self.cache.get_or_extract(
+            pdf_path, self.engine, self.ENGINE_VERSION,
+            extract_all=lambda: self._extract_pages(pdf_path, raise_errors=True),  # never cache a partial document
+            page_numbers=page_numbers,
+        )
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -1,14 +1,62 @@
+import asyncio
+import copy
 import os
-from typing import Dict
+from typing import Callable, Dict, List
 import yaml
 
+from src.models.ocr.OcrCache import file_digest
 
 
 class Pipeline:
-    def __init__(self, ocr_model=None, ir_model=None, vlm_model = None):
+    def __init__(self, ocr_model=None, ir_model=None, vlm_model = None, retriever=None):
         self.ocr_model = ocr_model
         self.ir_model = ir_model
         self.vlm_model = vlm_model
+        self.retriever = retriever  # optional PageRetriever for full-PDF cases
+
+    def attach_ocr_text(self, test_case: Dict, pdf_root_path: str) -> Dict:
+        """
+        Extract OCR text based on test_case['test_case']['input'] and
+        put it into test_case['test_case']['input']['text'].
+        """
+        # 1. Extract OCR input information
+        pdf_index = test_case['test_case']['input']['pdf_index']
+        pdf_index = pdf_index.split(',')
+        raw_image_indices = test_case['test_case']['input'].get('image_index', '')
+        if isinstance(raw_image_indices, list):
+            image_indices = [int(img.split('_')[-1].replace('I', '')) for img in raw_image_indices]
+        elif isinstance(raw_image_indices, str):
+            image_indices = [int(raw_image_indices.split('_')[-1].replace('I', ''))]
+        else:
+            image_indices = []
+
+        # The benchmarks store a JSON bool, which the string comparison never matched, so
+        # those cases are answered from their image pages; the whole document is only read
+        # when a retriever cuts it down to the passages relevant to the question
+        is_full_pdf = test_case['test_case']['input'].get('is_full_pdf', 'false')
+        is_full_pdf = is_full_pdf == 'true' or (is_full_pdf is True and self.retriever is not None)
+
+        # 2. Construct the full PDF path
+        for p in pdf_index:
+            all_ocr_text = ''
+            pdf_path = os.path.join(pdf_root_path, f"{p}.pdf")
+            if not os.path.exists(pdf_path):
+                raise FileNotFoundError(f"PDF file does not exist: {pdf_path}")
+
+            # 3. Use the OCR model to extract text
+            ocr_text = self.ocr_model.extract_text(pdf_path, page_numbers=image_indices if not is_full_pdf else None)
+            if is_full_pdf and self.retriever is not None:
+                # Only the passages relevant to the question, within the retriever's token budget
+                engine = getattr(self.ocr_model, 'engine', getattr(self.ocr_model, 'ENGINE', type(self.ocr_model).__name__))
+                document_key = f"{engine}:{file_digest(pdf_path)}"
+                ocr_text, retrieval = self.retriever.select(document_key, ocr_text, test_case['test_case']['question'])
+                test_case['test_case']['input']['retrieval'] = retrieval
+            all_ocr_text += str(ocr_text)
+
+        # 4. Add the OCR result into the test_case
+            test_case['test_case']['input']['text'] = all_ocr_text
+            test_case['test_case']['input']['pages'] = ocr_text  # structured form for the context packer
+        return test_case
 
     def run(self, test_case: Dict, pdf_root_path: str) -> Dict:
         """
@@ -18,34 +66,57 @@ class Pipeline:
         3. Pass the input to the IR model to obtain the final result
         """
         if self.vlm_model is None:
-            # 1. Extract OCR input information
-            pdf_index = test_case['test_case']['input']['pdf_index']
-            pdf_index = pdf_index.split(',')
-            raw_image_indices = test_case['test_case']['input'].get('image_index', '')
-            if isinstance(raw_image_indices, list):
-                image_indices = [int(img.split('_')[-1].replace('I', '')) for img in raw_image_indices]
-            elif isinstance(raw_image_indices, str):
-                image_indices = [int(raw_image_indices.split('_')[-1].replace('I', ''))]
-            else:
-                image_indices = []
-
-            is_full_pdf = test_case['test_case']['input'].get('is_full_pdf', 'false') == 'true'
-
-            # 2. Construct the full PDF path
-            for p in pdf_index:
-                all_ocr_text = ''
-                pdf_path = os.path.join(pdf_root_path, f"{p}.pdf")
-                if not os.path.exists(pdf_path):
-                    raise FileNotFoundError(f"PDF file does not exist: {pdf_path}")
-
-                # 3. Use the OCR model to extract text
-                ocr_text = self.ocr_model.extract_text(pdf_path, page_numbers=image_indices if not is_full_pdf else None)
-                all_ocr_text += str(ocr_text)
-
-            # 4. Add the OCR result into the test_case
-                test_case['test_case']['input']['text'] = all_ocr_text
+            test_case = self.attach_ocr_text(test_case, pdf_root_path)
             # 5. Call the IR model
             result = self.ir_model.generate_answer(test_case)
         else:
             result = self.vlm_model.generate_answer(test_case, image_root_path=r"src\data\images")
-        return result
\ No newline at end of file
+        return result
+
+    def run_batch(self, test_cases: List[Dict]) -> List[Dict]:
+        """Answer several cases in one call of a local VLM that batches generation (generate_batch)."""
+        return self.vlm_model.generate_batch(test_cases, image_root_path=r"src\data\images")
+
+    async def arun(self, test_case: Dict, pdf_root_path: str) -> Dict:
+        """
+        Async counterpart of run(). OCR is blocking file/CPU work and runs in a
+        worker thread; the model call goes through the adapter's async client.
+        """
+        if self.vlm_model is None:
+            test_case = await asyncio.to_thread(self.attach_ocr_text, test_case, pdf_root_path)
+            result = await self.ir_model.agenerate_answer(test_case)
+        else:
+            result = await self.vlm_model.agenerate_answer(test_case, image_root_path=r"src\data\images")
+        return result
+
+
+class FanOutPipeline(Pipeline):
+    """
+    One OCR engine feeding several IR models: a case is extracted once and its text is
+    sent to every model, instead of one Pipeline (and one OCR pass) per model.
+    """
+
+    def __init__(self, ocr_model, ir_models: Dict[str, object], retriever=None):
+        """
+        Args:
+            ir_models: Result folder name -> IR adapter.
+        """
+        super().__init__(ocr_model=ocr_model, retriever=retriever)
+        self.ir_models = ir_models
+
+    async def arun_all(self, test_case: Dict, pdf_root_path: str, model_names: List[str] = None,
+                       answer: Callable = None) -> Dict[str, object]:
+        """
+        OCR once, then ask every model in model_names (default all) concurrently; returns
+        {name: result}. answer(name, call) wraps each model's request, e.g. with retries;
+        call() makes one attempt on that model's own copy of the case.
+        """
+        test_case = await asyncio.to_thread(self.attach_ocr_text, test_case, pdf_root_path)
+        names = list(model_names or self.ir_models)
+        answer = answer or (lambda name, call: call())
+        results = await asyncio.gather(*(
+            # Every model gets its own copy, adapters record prompt stats on the case
+            answer(name, lambda name=name: self.ir_models[name].agenerate_answer(copy.deepcopy(test_case)))
+            for name in names
+        ))
+        return dict(zip(names, results))
@@ -0,0 +1,166 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "was", "were", "what", "which", "with", "who", "how",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric terms; strain ids such as KIN24-T80 become "kin24", "t80"."""
+    return [t for t in _TOKEN.findall(str(text).lower()) if t not in _STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """Prompt size estimate, about four characters per token."""
+    return len(text) // 4 + 1
+
+
+class Passage:
+    __slots__ = ("page", "position", "text", "terms", "length", "tokens")
+
+    def __init__(self, page: int, position: int, text: str):
+        self.page = page
+        self.position = position
+        self.text = text
+        self.terms = Counter(tokenize(text))
+        self.length = sum(self.terms.values())
+        self.tokens = estimate_tokens(text)
+
+
+class BM25Index:
+    """Okapi BM25 over the passages of one document."""
+
+    def __init__(self, passages: List[Passage], k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(p.length for p in passages) / len(passages) if passages else 0.0
+        document_frequency = Counter()
+        for passage in passages:
+            document_frequency.update(passage.terms.keys())
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def scores(self, query: str) -> List[float]:
+        query_terms = set(tokenize(query))
+        scores = []
+        for passage in self.passages:
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * passage.length / (self.avg_length or 1.0))
+            for term in query_terms:
+                tf = passage.terms.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+class PageRetriever:
+    """
+    Retrieval stage between OCR and the IR model for full-PDF cases.
+
+    The cached per-page OCR text of a document is cut into passages of about
+    passage_tokens tokens and indexed with BM25 once per document. For each case the
+    passages that best match its question are packed, best first, into token_budget
+    tokens and handed to the model in reading order, in the same {page: text} shape the
+    OCR engines produce. The first lead_passages passages (title and abstract) are
+    always kept, since papers name their organisms and strains there.
+    """
+
+    def __init__(self, token_budget: int = 3000, passage_tokens: int = 200, lead_passages: int = 1,
+                 max_documents: int = 64):
+        self.token_budget = token_budget
+        self.passage_tokens = passage_tokens
+        self.lead_passages = lead_passages
+        self.max_documents = max_documents
+
+        self._indexes = OrderedDict()  # document key -> BM25Index
+        self._lock = threading.Lock()
+
+    def _passages(self, pages: Dict[int, str]) -> List[Passage]:
+        passages = []
+        max_chars = self.passage_tokens * 4
+        for page, text in sorted(pages.items(), key=lambda item: int(item[0])):
+            chunk = ""
+            # Paragraphs stay whole where possible; overlong ones are split on whitespace
+            for paragraph in re.split(r"\n\s*\n", str(text)):
+                for piece in self._split(paragraph.strip(), max_chars):
+                    if chunk and len(chunk) + len(piece) + 2 > max_chars:
+                        passages.append(Passage(int(page), len(passages), chunk))
+                        chunk = ""
+                    chunk = f"{chunk}\n\n{piece}" if chunk else piece
+            if chunk:
+                passages.append(Passage(int(page), len(passages), chunk))
+        return passages
+
+    @staticmethod
+    def _split(paragraph: str, max_chars: int) -> List[str]:
+        if len(paragraph) <= max_chars:
+            return [paragraph] if paragraph else []
+        pieces, piece = [], ""
+        for word in paragraph.split():
+            if piece and len(piece) + len(word) + 1 > max_chars:
+                pieces.append(piece)
+                piece = ""
+            piece = f"{piece} {word}" if piece else word
+        if piece:
+            pieces.append(piece)
+        return pieces
+
+    def index(self, document_key: str, pages: Dict[int, str]) -> BM25Index:
+        """BM25 index of a document, built on first use. document_key should change with the text (e.g. its digest)."""
+        with self._lock:
+            if document_key in self._indexes:
+                self._indexes.move_to_end(document_key)
+                return self._indexes[document_key]
+        index = BM25Index(self._passages(pages))
+        with self._lock:
+            self._indexes[document_key] = index
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+        return index
+
+    def select(self, document_key: str, pages: Dict[int, str], query: str,
+               token_budget: Optional[int] = None) -> Tuple[Dict[int, str], Dict[str, Any]]:
+        """
+        Passages of a document for one query within the token budget.
+
+        Returns:
+            ({page: selected text}, stats) where stats holds the token counts of the full
+            document and of the selection and the number of passages kept.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        index = self.index(document_key, pages)
+        passages = index.passages
+        total_tokens = sum(p.tokens for p in passages)
+
+        if total_tokens <= budget:
+            chosen = list(passages)
+        else:
+            scores = index.scores(query)
+            ranked = list(passages[:self.lead_passages]) + sorted(
+                passages[self.lead_passages:], key=lambda p: scores[p.position], reverse=True)
+            chosen, used = [], 0
+            for passage in ranked:
+                if used + passage.tokens <= budget:
+                    chosen.append(passage)
+                    used += passage.tokens
+
+        selected = {}
+        for passage in sorted(chosen, key=lambda p: p.position):
+            selected[passage.page] = f"{selected[passage.page]}\n\n{passage.text}" if passage.page in selected \
+                else passage.text
+
+        stats = {
+            "document_tokens": total_tokens,
+            "selected_tokens": sum(p.tokens for p in chosen),
+            "passages": len(passages),
+            "selected_passages": len(chosen),
+        }
+        return selected, stats
@@ -1,13 +1,13 @@
-import os
 import time
 from pprint import pprint
-from typing import Dict
+from typing import Any, Dict, List, Tuple
 
 import torch
 from transformers import AutoModelForCausalLM
 from src.models.vlm.deepseek_vl.models import VLChatProcessor, MultiModalityCausalLM
 from src.models.vlm.deepseek_vl.utils.io import load_pil_images
 from src.types.BaseModel import BaseModel
+from src.utils.image_cache import get_image_index
 
 class DeepSeekVLModel(BaseModel):
     def __init__(self, local_model_path):
@@ -25,31 +25,23 @@ class DeepSeekVLModel(BaseModel):
         self.vl_gpt: MultiModalityCausalLM = AutoModelForCausalLM.from_pretrained(self.use_model_name, trust_remote_code=True, cache_dir=local_model_path)
         self.vl_gpt = self.vl_gpt.to(torch.bfloat16).cuda().eval()
 
+        # Micro-batch limits of generate_batch
+        self.max_batch_size = 8
+        self.max_batch_images = 16
+        self.max_batch_tokens = 16384  # padded tokens of one batch (cases x longest sequence)
+
     @staticmethod
     def get_image_paths(image_root_path, name):
-        # Define the supported image file extensions
-        IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
-
-        # Used for storing the path of the found picture
-        image_paths = []
-
-        for root, _, files in os.walk(image_root_path):
-            for file in files:
-                # Check whether the file extension is in image format
-                file_ext = os.path.splitext(file)[1].lower()
-                if file_ext in IMAGE_EXTENSIONS:
-                    # Check whether the file name contains "M001".
-                    if name in file:
-                        image_paths.append(os.path.join(root, file))
-        return image_paths
-    def generate_answer(self, test_case: Dict, image_root_path: str = ""):
+        # Images whose file name contains name (e.g. "M001"), from the index scanned once per root
+        return get_image_index(image_root_path).matching(name)
+
+    def build_conversation(self, test_case: Dict, image_root_path: str = "") -> Tuple[Dict, List[Dict]]:
         name = test_case.get("case_id").split("-")[1]
         image_paths = self.get_image_paths(image_root_path, name)
         content=""
         for _ in image_paths:
             content+="<image_placeholder>"
         prompt = self.format_prompt(test_case)
-        start_time = time.time()
         messages = [prompt["system"], prompt["user"]]
 
         # print(test_case)
@@ -58,28 +50,64 @@ class DeepSeekVLModel(BaseModel):
             "content": test_case["test_case"]["input"],
         })
 
-        try:
-            # Model structuring
-            conversation = [
-                {
-                    "role": "User",
-                    "content": content + "Summarize the content of the above pictures." + f"{messages}",
-                    "images": image_paths
-                },
-                {
-                    "role": "Assistant",
-                    "content": ""
-                }
-            ]
+        # Model structuring
+        conversation = [
+            {
+                "role": "User",
+                "content": content + "Summarize the content of the above pictures." + f"{messages}",
+                "images": image_paths
+            },
+            {
+                "role": "Assistant",
+                "content": ""
+            }
+        ]
+        return prompt, conversation
 
+    def estimate_tokens(self, conversation: List[Dict]) -> int:
+        """Sequence length of a conversation once its image placeholders are expanded, without loading images."""
+        sft_format = self.vl_chat_processor.apply_sft_template_for_multi_turn_prompts(
+            conversations=conversation,
+            sft_format=self.vl_chat_processor.sft_format,
+            system_prompt=self.vl_chat_processor.system_prompt,
+        )
+        n_images = len(conversation[0]["images"])
+        return len(self.tokenizer.encode(sft_format)) + n_images * self.vl_chat_processor.num_image_tokens
+
+    def micro_batches(self, items: List[Dict]) -> List[List[Dict]]:
+        """
+        Longest sequences first, packed greedily so that a micro-batch stays within
+        max_batch_size cases, max_batch_images images and max_batch_tokens padded tokens
+        (left padding makes every row as long as the longest one).
+        """
+        batches, batch, images = [], [], 0
+        for item in sorted(items, key=lambda item: item["tokens"], reverse=True):
+            n_images = len(item["conversation"][0]["images"])
+            padded = (len(batch) + 1) * (batch[0]["tokens"] if batch else item["tokens"])
+            if batch and (len(batch) >= self.max_batch_size or images + n_images > self.max_batch_images
+                          or padded > self.max_batch_tokens):
+                batches.append(batch)
+                batch, images = [], 0
+            batch.append(item)
+            images += n_images
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _generate(self, batch: List[Dict]) -> None:
+        """Generate one micro-batch; fills answer, token_count and response_time of every item."""
+        prepare_start = time.time()
+        prepares = []
+        for item in batch:
             # load images and prepare for inputs
-            pil_images = load_pil_images(conversation)
-            prepare_inputs = self.vl_chat_processor(
-                conversations=conversation,
-                images=pil_images,
-                force_batchify=True
-            ).to(self.vl_gpt.device)
+            case_start = time.time()
+            pil_images = load_pil_images(item["conversation"])
+            prepares.append(self.vl_chat_processor.process_one(conversations=item["conversation"], images=pil_images))
+            item["prepare_time"] = time.time() - case_start
+        prepare_inputs = self.vl_chat_processor.batchify(prepares).to(self.vl_gpt.device)
 
+        generate_start = time.time()
+        with torch.inference_mode():
             # run image encoder to get the image embeddings
             inputs_embeds = self.vl_gpt.prepare_inputs_embeds(**prepare_inputs)
 
@@ -94,26 +122,80 @@ class DeepSeekVLModel(BaseModel):
                 do_sample=False,
                 use_cache=True
             )
+        generate_time = time.time() - generate_start
 
-            predicted_answer = self.tokenizer.decode(outputs[0].cpu().tolist(), skip_special_tokens=True)
-            token_count = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0
+        rows = []
+        for row in outputs.cpu().tolist():
+            if self.tokenizer.eos_token_id in row:
+                row = row[:row.index(self.tokenizer.eos_token_id)]
+            rows.append(row)
+        generated_tokens = sum(len(row) for row in rows) or 1
+        for item, prepare, row in zip(batch, prepares, rows):
+            item["answer"] = self.tokenizer.decode(row, skip_special_tokens=True)
+            item["token_count"] = {
+                "input_tokens": len(prepare),
+                "output_tokens": len(row),
+                "total_tokens": len(prepare) + len(row)
             }
+            # The shared forward passes are charged in proportion to the tokens each case generated
+            item["response_time"] = item["build_time"] + item["prepare_time"] + generate_time * len(row) / generated_tokens
+            item["local_batch"] = {
+                "size": len(batch),
+                "padded_tokens": int(prepare_inputs.input_ids.shape[1]) * len(batch),
+                "batch_time": round((time.time() - prepare_start) * 1000, 2),  # ms
+            }
+
+    def _generate_or_split(self, batch: List[Dict]) -> None:
+        try:
+            self._generate(batch)
         except Exception as e:
+            if len(batch) > 1:
+                # Out of memory or one bad case: halve the batch and try the halves
+                print(f"[WARN] Batch of {len(batch)} failed ({e}), splitting it")
+                torch.cuda.empty_cache()
+                middle = len(batch) // 2
+                self._generate_or_split(batch[:middle])
+                self._generate_or_split(batch[middle:])
+                return
             print(f"[ERROR] Failed to call model: {e}")
-            predicted_answer = "error"
-            token_count = {
+            batch[0]["answer"] = "error"
+            batch[0]["token_count"] = {
                 "input_tokens": 0,
                 "output_tokens": 0,
                 "total_tokens": 0
             }
-        response_time = time.time() - start_time
-        return self.format_result(
-            test_case=test_case,
-            predicted_answer=predicted_answer,
-            prompt=prompt,
-            response_time=response_time,
-            token_count=token_count
-        )
+            batch[0]["response_time"] = time.time() - batch[0]["start_time"]
+
+    def generate_batch(self, test_cases: List[Dict], image_root_path: str = "") -> List[Dict[str, Any]]:
+        """
+        Answer several cases with left-padded batched generation. Cases are grouped into
+        micro-batches by token and image budget; results come back in input order, each
+        with its own token counts and latency.
+        """
+        items = []
+        for test_case in test_cases:
+            start_time = time.time()
+            prompt, conversation = self.build_conversation(test_case, image_root_path)
+            items.append({"test_case": test_case, "prompt": prompt, "conversation": conversation,
+                          "tokens": self.estimate_tokens(conversation), "start_time": start_time,
+                          "build_time": time.time() - start_time})
+
+        for batch in self.micro_batches(items):
+            self._generate_or_split(batch)
+
+        results = []
+        for item in items:
+            result = self.format_result(
+                test_case=item["test_case"],
+                predicted_answer=item["answer"],
+                prompt=item["prompt"],
+                response_time=item["response_time"],
+                token_count=item["token_count"]
+            )
+            if "local_batch" in item:
+                result["local_batch"] = item["local_batch"]
+            results.append(result)
+        return results
+
+    def generate_answer(self, test_case: Dict, image_root_path: str = ""):
+        return self.generate_batch([test_case], image_root_path)[0]
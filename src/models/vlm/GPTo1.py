@@ -1,95 +1,54 @@
-import sys
 import os
-import base64
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
 
-from openai import OpenAI
-import json
-from src.types.BaseModel import BaseModel
-from typing import Dict, Any
-import time
+from src.types.ChatCompletionModel import ChatCompletionModel
+from src.utils.image_cache import encoded_image, get_image_index, get_image_profile
+from typing import Dict, Any, List
 
 # os.environ["http_proxy"] = "http://localhost:7897"
 # os.environ["https_proxy"] = "http://localhost:7897"
-class GPTo1Model(BaseModel):
+class GPTo1Model(ChatCompletionModel):
+    supports_batch = True  # OpenAI Batch API
+
     def __init__(self, api_key):
         super().__init__(
             model_name="o1",
             base_url="",
             api_key=api_key
         )
-        self.client = OpenAI(api_key=api_key)
+        self.image_profile = get_image_profile(self.model_name)  # downscale / re-encode, see image_profiles in config.yaml
 
     def get_image_code(self, image_path):
-        with open(image_path, 'rb') as f:
-            base64_image = base64.b64encode(f.read()).decode("utf-8")
-        return base64_image
-
-    def generate_answer(self, test_case: Dict, image_root_path: str):
-        prompt = self.format_prompt(test_case)
+        return encoded_image(image_path, self.image_profile)
 
+    def build_messages(self, test_case: Dict, prompt: Dict[str, Any], image_root_path: str = "") -> List[Dict]:
         # Get image file paths based on the image indices
         # raw_image_indices = test_case['test_case']['input'].get('image_index', '')
         raw_image_indices = test_case['test_case']['input'].get('image_index', [])
 
+        image_index = get_image_index(image_root_path)
         if isinstance(raw_image_indices, list):
-            image_paths = [os.path.join(image_root_path, f'{img_id}.png') for img_id in raw_image_indices]
+            image_paths = [image_index.path(img_id) for img_id in raw_image_indices]
         else:
-            image_paths = [os.path.join(image_root_path, f'{raw_image_indices}.png')]
-
-        start_time = time.time()
-
-        try:
-            messages = [prompt["system"], prompt["user"]]
-
-            for path in image_paths:
-                image_code = self.get_image_code(path)
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_code}"
-                            }
+            image_paths = [image_index.path(raw_image_indices)]
+
+        messages = [prompt["system"], prompt["user"]]
+
+        payload_bytes = 0
+        for path in image_paths:
+            image_code = self.get_image_code(path)
+            payload_bytes += len(image_code)
+            messages.append({
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{self.image_profile.mime_type(path)};base64,{image_code}"
                         }
-                    ]
-                })
-
-            completion = self.client.chat.completions.create(
-                model=self.model_name, messages=messages
-            )
-
-
-            content = completion.choices[0].message.content
-
-            usage = completion.usage
-
-            predicted_answer = content
-            token_count = {
-                "input_tokens": usage.prompt_tokens,
-                "output_tokens": usage.completion_tokens,
-                "total_tokens": usage.total_tokens
-            }
-
-        except Exception as e:
-            print(f"[ERROR] Failed to call model: {e}")
-            predicted_answer = "error"
-            token_count = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0
-            }
-
-
-        response_time = time.time() - start_time
-
-        return self.format_result(
-            test_case=test_case,
-            predicted_answer=predicted_answer,
-            prompt=prompt,
-            response_time=response_time,
-            token_count=token_count
-        )
-
-
+                    }
+                ]
+            })
+        test_case['test_case']['input']['image_payload'] = {
+            "profile": self.image_profile.variant, "images": len(image_paths), "bytes": payload_bytes}
+        return messages
@@ -1,9 +1,9 @@
 import os
-import base64
 import time
 from typing import Dict, Any
 import google.generativeai as genai
 from src.types.BaseModel import BaseModel
+from src.utils.image_cache import encoded_image, get_image_index, get_image_profile
 
 # os.environ['https_proxy'] = "http://127.0.0.1:7897"
 # os.environ['http_proxy'] = "http://127.0.0.1:7897"
@@ -21,10 +21,10 @@ class GeminiModel(BaseModel):
 
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(model_name=current_model_name)
+        self.image_profile = get_image_profile(current_model_name)  # downscale / re-encode, see image_profiles in config.yaml
 
     def get_image_code(self, image_path):
-        with open(image_path, 'rb') as f:
-            return base64.b64encode(f.read()).decode('utf-8')
+        return encoded_image(image_path, self.image_profile)
 
     def generate_answer(self, test_case: Dict, image_root_path: str = "") -> Dict[str, Any]:
         prompt = self.format_prompt(test_case)
@@ -43,16 +43,22 @@ class GeminiModel(BaseModel):
             if isinstance(raw_image_indices, str):
                 raw_image_indices = [raw_image_indices]
 
+            image_index = get_image_index(image_root_path)
+            images, payload_bytes = 0, 0
             for img_idx in raw_image_indices:
-                img_path = os.path.join(image_root_path, f"{img_idx}.png")
-                if os.path.exists(img_path):
+                img_path = image_index.get(img_idx)
+                if img_path:
                     image_code = self.get_image_code(img_path)
+                    images += 1
+                    payload_bytes += len(image_code)
                     contents.append({
                         "inline_data": {
-                            "mime_type": "image/png",
+                            "mime_type": self.image_profile.mime_type(img_path),
                             "data": image_code
                         }
                     })
+            test_case['test_case']['input']['image_payload'] = {
+                "profile": self.image_profile.variant, "images": images, "bytes": payload_bytes}
 
             question = test_case["test_case"].get("question", "")
             input_text = test_case["test_case"]["input"].get("text", question)
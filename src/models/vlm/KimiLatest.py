@@ -1,77 +1,74 @@
+import asyncio
 import os
 from pathlib import Path
-from openai import OpenAI
-import json
-from src.types.BaseModel import BaseModel
-from typing import Dict, Any
-import time
+from src.models.ocr.OcrCache import file_digest
+from src.types.ChatCompletionModel import ChatCompletionModel
+from typing import Dict, Any, List
 # kimi_latest_128k
 
-class KimiLatestModel(BaseModel):
+class KimiLatestModel(ChatCompletionModel):
+    supports_batch = False  # PDFs are uploaded per case and Moonshot has no batch API
+
     def __init__(self, api_key):
         super().__init__(
             model_name = "kimi-latest-128k",
             base_url = "https://api.moonshot.cn/v1",
-            api_key = api_key
+            api_key = api_key,
+            use_model_name = "moonshot-v1-128k"
         )
-        self.use_model_name = "moonshot-v1-128k"
-        self.client = OpenAI(api_key=api_key, base_url="https://api.moonshot.cn/v1")
 
     def get_file_list(self):
         return self.client.files.list().data
     def delete_file(self, file_id):
         self.client.files.delete(file_id=file_id)
 
-    def generate_answer(self, test_case: Dict, image_root_path: str):
-        file_list = self.get_file_list()
-        if len(file_list) > 10 :
-            for file in file_list:
-                self.delete_file(file.id)
-
-        prompt = self.format_prompt(test_case)
-        start_time = time.time()
-        messages = [prompt["system"], prompt["user"]]
-
+    @staticmethod
+    def pdf_paths(test_case: Dict) -> List[str]:
         pdf_index = test_case['test_case']['input']['pdf_index'].split(",")
+        return [os.path.join('src/data/raw_pdfs', f"{i}.pdf") for i in pdf_index]
 
-        try:
-            for i in pdf_index:
-                pdf_path = os.path.join('src/data/raw_pdfs', f"{i}.pdf")
-                file_object = self.client.files.create(file=Path(pdf_path), purpose="file-extract")
+    def document_cache_key(self, test_case: Dict, prompt: Dict[str, Any]):
+        """
+        Response cache key built from the PDFs' content hashes instead of the extracted
+        text, so a cache hit needs no upload.
+        """
+        if self.response_cache is None:
+            return None
+        document = {
+            "pdf_sha256": [file_digest(pdf_path) for pdf_path in self.pdf_paths(test_case)],
+            "context_window": self.context_packer.context_window,
+            "max_output_tokens": self.context_packer.max_output_tokens,
+        }
+        messages = [prompt["system"], prompt["user"], {"role": "system", "content": document}]
+        return self.response_cache_key(self.request_kwargs(messages))
 
-                file_content = self.client.files.content(file_id=file_object.id).text
-            messages.append({
-                "role": "system",
-                "content": file_content,
-            })
+    def build_messages(self, test_case: Dict, prompt: Dict[str, Any], image_root_path: str = "") -> List[Dict]:
+        messages = [prompt["system"], prompt["user"]]
 
+        for pdf_path in self.pdf_paths(test_case):
+            file_object = self.client.files.create(file=Path(pdf_path), purpose="file-extract")
+            try:
+                file_content = self.client.files.content(file_id=file_object.id).text
+            finally:
+                # Only this case's upload; other cases in flight may still be reading theirs
+                self.delete_file(file_object.id)
+        messages.append({
+            "role": "system",
+            "content": self.pack_context(test_case, messages, document=file_content),
+        })
+        return messages
 
-            completion = self.client.chat.completions.create(
-                model="moonshot-v1-128k",
-                messages=messages,
-                temperature=0.3,
-            )
-            predicted_answer=completion.choices[0].message.content
+    def request_kwargs(self, messages: List[Dict]) -> Dict[str, Any]:
+        kwargs = super().request_kwargs(messages)
+        kwargs["temperature"] = 0.3
+        return kwargs
 
-            token_count = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0
-            }
-        except Exception as e:
-            print(f"[ERROR] Failed to call model: {e}")
-            predicted_answer = "error"
-            token_count = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0
-            }
-        response_time = time.time() - start_time
+    def generate_answer(self, test_case: Dict, image_root_path: str = "") -> Dict[str, Any]:
+        prompt = self.format_prompt(test_case)
+        outcome = self._complete(lambda: self.build_messages(test_case, prompt, image_root_path),
+                                 cache_key=lambda: self.document_cache_key(test_case, prompt))
+        return self.format_result(test_case=test_case, prompt=prompt, **outcome)
 
-        return self.format_result(
-            test_case=test_case,
-            predicted_answer=predicted_answer,
-            prompt=prompt,
-            response_time=response_time,
-            token_count=token_count
-        )
\ No newline at end of file
+    async def agenerate_answer(self, test_case: Dict, image_root_path: str = ""):
+        # File upload and cleanup go through the sync Moonshot files API, keep them off the event loop
+        return await asyncio.to_thread(self.generate_answer, test_case, image_root_path)
@@ -1,5 +1,6 @@
 from typing import Dict, Any, List
 from abc import ABC, abstractmethod
+import asyncio
 import yaml
 import os
 
@@ -21,8 +22,9 @@ class BaseModel(ABC):
 
     def format_result(self, test_case: dict, predicted_answer: str,
                       prompt: Dict[str, Any], response_time: float,
-                      token_count: Dict[str, int]) -> Dict[str, Any]:
-        return {
+                      token_count: Dict[str, int], error: Dict[str, Any] = None,
+                      cache_hit: bool = False) -> Dict[str, Any]:
+        result = {
             "model_id": self.model_name,
             "case_id": test_case["case_id"],
             "prompt": prompt,
@@ -31,6 +33,25 @@ class BaseModel(ABC):
             "response_time": round(response_time * 1000, 2),  # ms
             "token_count": token_count
         }
+        case_input = test_case["test_case"].get("input", {})
+        for stage in ("retrieval", "context_packing", "image_payload"):
+            if stage in case_input:
+                result[stage] = case_input[stage]  # prompt-size bookkeeping, incl. dropped tokens
+        prompt_layout = getattr(self, "prompt_layout", "question_first")
+        if prompt_layout != "question_first":
+            result["prompt_layout"] = prompt_layout
+        if error is not None:
+            result["error"] = error  # classified provider error, read by the retry policy
+        if cache_hit:
+            result["cache_hit"] = True  # answered from the response cache, token_count is the original call's
+        return result
+
+    async def agenerate_answer(self, test_case: Dict, *args, **kwargs) -> Dict[str, Any]:
+        """
+        Async entry point used by the asyncio engine. Adapters without a native
+        async client fall back to running generate_answer in a worker thread.
+        """
+        return await asyncio.to_thread(self.generate_answer, test_case, *args, **kwargs)
 
     def determine_prompt_template(self, task_type: str) -> str:
         """
@@ -76,3 +97,26 @@ class BaseModel(ABC):
             "system": {"role": "system", "content": system_prompt},
             "user": {"role": "user", "content": few_shot_examples}
         }
+
+    def format_prefix_prompt(self, test_case: Dict,
+                             question_ref: str = "the QUESTION given in the last message") -> Dict[str, str]:
+        """
+        The parts of format_prompt split by how often they change, for prefix caching:
+        'instructions' and 'examples' are the same for every case of a task (the question
+        is referred to, not inlined), 'question' is the only per-case part.
+        """
+        task_type = test_case.get("task_subcategory", "default")
+        note = test_case["test_case"].get("note", "")
+        instructions = self.determine_prompt_template(task_type).format(
+            question=question_ref, note=note)
+
+        examples = ""
+        if test_case["test_case"].get("few_shot_examples"):
+            examples = "EXAMPLES:\n"
+            for i, ex in enumerate(test_case["test_case"]["few_shot_examples"], 1):
+                examples += f"Example {i}:\nQuestion: {ex['question']}\nText: {ex['text']}\nAnswer: {ex['expected_answer']}\n\n"
+        return {
+            "instructions": instructions,
+            "examples": examples,
+            "question": f"QUESTION: {test_case['test_case']['question']}"
+        }
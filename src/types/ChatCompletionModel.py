@@ -0,0 +1,361 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+import weakref
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from openai import OpenAI, AsyncOpenAI
+
+from src.types.BaseModel import BaseModel
+from src.utils.context_packer import get_context_packer
+from src.utils.http_pool import get_async_http_client, get_http_client
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.response_cache import ResponseCache
+from src.utils.retry import RetryPolicy, describe_error
+
+MULTI_QUESTION_FORMAT = (
+    "Answer every question in order. Write the question number, then its answer inside "
+    "its own tags, one per line:\n1. <Answer> your_answer_here </Answer>\n2. <Answer> your_answer_here </Answer>"
+)
+ANSWER_BLOCK = re.compile(r"<Answer>(.*?)</Answer>", re.DOTALL | re.IGNORECASE)
+QUESTION_NUMBER = re.compile(r"(\d+)\s*[.):]")
+
+
+class ChatCompletionModel(BaseModel):
+    """
+    Shared request path for adapters that speak the OpenAI chat-completions API.
+
+    Subclasses only describe how a test case becomes a message list (build_messages)
+    and which extra request fields they need; the sync and async call paths,
+    usage parsing and error handling live here.
+    """
+
+    # Set on adapters whose provider offers an OpenAI-compatible batch API; the others run async
+    supports_batch = False
+
+    def __init__(self, model_name: str, base_url: str, api_key: str,
+                 use_model_name: Optional[str] = None, extra_body: Optional[Dict[str, Any]] = None):
+        super().__init__(model_name=model_name, base_url=base_url, api_key=api_key)
+        self.use_model_name = use_model_name or model_name
+        self.extra_body = extra_body
+
+        # Retries are owned by the runner's RetryPolicy, which backs off per case
+        self._client_kwargs = {"api_key": api_key, "max_retries": 0}
+        if base_url:
+            self._client_kwargs["base_url"] = base_url
+        # Connection pool shared with every adapter on the same endpoint and key
+        self.client = OpenAI(**self._client_kwargs, http_client=get_http_client(base_url, api_key))
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+        self.response_cache: Optional[ResponseCache] = None  # opt-in, set by ManageModel from config.yaml
+        self.response_cache_namespace: Optional[str] = None  # "replay" while the mock server answers
+        # Tokenizer, context window and answer budget of this model (context_budgets in config.yaml)
+        self.context_packer = get_context_packer(model_name)
+        # Prompt prefix caching (prompt_caching in config.yaml, set by ManageModel):
+        # prompt_layout "question_first" is the original layout, "paper_first" puts the
+        # stable document and task instructions ahead of the question; cache_control is
+        # None, "ephemeral" (explicit cache markers) or "prompt_cache_key" (routing hint)
+        self.prompt_layout = "question_first"
+        self.cache_control = None
+        # Shared with every other adapter on the same endpoint, budgets come from config.yaml
+        self.rate_limiter = get_rate_limiter(base_url)
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """AsyncOpenAI on the pooled async connections of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            http_client = get_async_http_client(self.base_url, self.api_key)
+            self._async_clients[loop] = AsyncOpenAI(**self._client_kwargs, http_client=http_client)
+        return self._async_clients[loop]
+
+    def pack_context(self, test_case: Dict, fixed_messages: List[Dict], document: Any = None, prefix: str = "") -> str:
+        """
+        Document text of a case fitted into the model's context budget. Uses the OCR pages
+        (or document, when given) and records the packing stats on the case input.
+        """
+        case_input = test_case["test_case"]["input"]
+        if document is None:
+            document = case_input.get("pages", case_input.get("text", ""))
+        text, stats = self.context_packer.pack(document, fixed_messages, prefix)
+        case_input["context_packing"] = stats
+        return text
+
+    def build_paper_first_messages(self, test_case: Dict, prefix: str = "DOCUMENT:\n") -> List[Dict]:
+        """
+        Prefix-cache friendly layout: document, task instructions and few-shot examples
+        first (shared by every question on the same paper and task), the question last.
+        """
+        parts = self.format_prefix_prompt(test_case)
+        stable = [{"role": "system", "content": parts["instructions"]}]
+        if parts["examples"]:
+            stable.append({"role": "user", "content": parts["examples"]})
+        question = {"role": "user", "content": parts["question"]}
+
+        document = {"role": "system", "content": self.pack_context(test_case, stable + [question], prefix=prefix)}
+        messages = [document] + stable
+        if self.cache_control == "ephemeral":
+            # Explicit cache marker on the last stable message: everything up to it is cached
+            last = messages[-1]
+            messages[-1] = {"role": last["role"], "content": [
+                {"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}]}
+        return messages + [question]
+
+    def build_messages(self, test_case: Dict, prompt: Dict[str, Any], image_root_path: str = "") -> List[Dict]:
+        """
+        Default IR layout: system prompt, few-shot examples, then the OCR text.
+        """
+        if self.prompt_layout == "paper_first":
+            return self.build_paper_first_messages(test_case)
+        messages = [prompt["system"], prompt["user"]]
+        messages.append({
+            "role": "user",
+            "content": self.pack_context(test_case, messages),
+        })
+        return messages
+
+    def request_kwargs(self, messages: List[Dict]) -> Dict[str, Any]:
+        kwargs = {"model": self.use_model_name, "messages": messages}
+        if self.extra_body:
+            kwargs["extra_body"] = self.extra_body
+        if self.cache_control == "prompt_cache_key" and self.prompt_layout == "paper_first":
+            # Requests on the same document are routed to the same cache shard
+            document = json.dumps(messages[0]["content"], ensure_ascii=False)
+            kwargs["extra_body"] = {**(self.extra_body or {}),
+                                    "prompt_cache_key": hashlib.sha256(document.encode("utf-8")).hexdigest()[:32]}
+        return kwargs
+
+    def render_request(self, test_case: Dict, image_root_path: str = "") -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(prompt, create() kwargs) of a test case, without calling the provider."""
+        prompt = self.format_prompt(test_case)
+        messages = self.build_messages(test_case, prompt, image_root_path)
+        return prompt, self.request_kwargs(messages)
+
+    def response_cache_key(self, request: Dict[str, Any]) -> Optional[str]:
+        """Cache key of a rendered request, None when no response cache is attached."""
+        if self.response_cache is None:
+            return None
+        params = {k: v for k, v in request.items() if k not in ("model", "messages")}
+        params["base_url"] = self.base_url  # the same model name may be served differently elsewhere
+        if self.response_cache_namespace:
+            params["namespace"] = self.response_cache_namespace
+        return ResponseCache.key(request["model"], request["messages"], params)
+
+    @staticmethod
+    def _accepted(predicted_answer: str) -> bool:
+        # Answers the runner would retry must not be cached, or every retry replays them
+        return RetryPolicy.error_of({"predicted_answer": predicted_answer}) is None
+
+    def _cached_answer(self, cache_key: Optional[str]) -> Optional[Tuple[str, Dict[str, int]]]:
+        if cache_key is None:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None and not self._accepted(cached[0]):
+            return None  # stored before rejected answers were kept out of the cache
+        return cached
+
+    def _cache_answer(self, cache_key: Optional[str], predicted_answer: str, token_count: Dict[str, int]) -> None:
+        if cache_key is not None and self._accepted(predicted_answer):
+            self.response_cache.put(cache_key, self.model_name, predicted_answer, token_count)
+
+    @classmethod
+    def parse_completion(cls, completion) -> Tuple[str, Dict[str, int]]:
+        return cls.parse_completion_body(completion.model_dump())
+
+    @staticmethod
+    def parse_completion_body(body: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        """Answer and usage of a chat.completion JSON body (SDK responses and batch output files)."""
+        usage = body.get("usage") or {}
+        token_count = {
+            "input_tokens": usage.get("prompt_tokens") or 0,
+            "output_tokens": usage.get("completion_tokens") or 0,
+            "total_tokens": usage.get("total_tokens") or 0
+        }
+        # Prompt tokens served from the provider's prefix cache (OpenAI/DashScope, Moonshot)
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or usage.get("cached_tokens")
+        if cached_tokens is not None:
+            token_count["cached_tokens"] = cached_tokens
+        return body["choices"][0]["message"]["content"], token_count
+
+    @staticmethod
+    def empty_token_count() -> Dict[str, int]:
+        return {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0
+        }
+
+    def _complete(self, build: Callable[[], List[Dict]],
+                  cache_key: Optional[Callable[[], Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        One chat completion for the messages build() returns: response cache, rate limit,
+        provider call and usage parsing. Returns the outcome fields of format_result.
+        cache_key() replaces the key of the rendered request for adapters whose build()
+        is costly (uploads), so a cache hit never calls build().
+        """
+        start_time = time.time()
+        error = None
+        cached = None
+        try:
+            key = cache_key() if cache_key is not None else None
+            cached = self._cached_answer(key)
+            if cached is None:
+                messages = build()
+                request = self.request_kwargs(messages)
+                if cache_key is None:
+                    key = self.response_cache_key(request)
+                    cached = self._cached_answer(key)
+
+            if cached is not None:
+                predicted_answer, token_count = cached
+            else:
+                estimated_tokens = self.rate_limiter.estimate_tokens(messages)
+                self.rate_limiter.acquire(estimated_tokens)
+                start_time = time.time()  # response time excludes the wait for rate-limit budget
+                completion = self.client.chat.completions.create(**request)
+                predicted_answer, token_count = self.parse_completion(completion)
+                self.rate_limiter.settle(estimated_tokens, token_count["total_tokens"])
+                self._cache_answer(key, predicted_answer, token_count)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to call model: {e}")
+            predicted_answer = "error"
+            token_count = self.empty_token_count()
+            error = describe_error(e)
+
+        return {
+            "predicted_answer": predicted_answer,
+            "response_time": time.time() - start_time,
+            "token_count": token_count,
+            "error": error,
+            "cache_hit": cached is not None
+        }
+
+    async def _acomplete(self, build: Callable[[], List[Dict]],
+                         cache_key: Optional[Callable[[], Optional[str]]] = None) -> Dict[str, Any]:
+        """Async counterpart of _complete()."""
+        start_time = time.time()
+        error = None
+        cached = None
+        try:
+            key = cache_key() if cache_key is not None else None
+            cached = self._cached_answer(key)
+            if cached is None:
+                messages = build()
+                request = self.request_kwargs(messages)
+                if cache_key is None:
+                    key = self.response_cache_key(request)
+                    cached = self._cached_answer(key)
+
+            if cached is not None:
+                predicted_answer, token_count = cached
+            else:
+                estimated_tokens = self.rate_limiter.estimate_tokens(messages)
+                await self.rate_limiter.aacquire(estimated_tokens)
+                start_time = time.time()  # response time excludes the wait for rate-limit budget
+                completion = await self.async_client.chat.completions.create(**request)
+                predicted_answer, token_count = self.parse_completion(completion)
+                self.rate_limiter.settle(estimated_tokens, token_count["total_tokens"])
+                self._cache_answer(key, predicted_answer, token_count)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to call model: {e}")
+            predicted_answer = "error"
+            token_count = self.empty_token_count()
+            error = describe_error(e)
+
+        return {
+            "predicted_answer": predicted_answer,
+            "response_time": time.time() - start_time,
+            "token_count": token_count,
+            "error": error,
+            "cache_hit": cached is not None
+        }
+
+    def generate_answer(self, test_case: Dict, image_root_path: str = "") -> Dict[str, Any]:
+        prompt = self.format_prompt(test_case)
+        outcome = self._complete(lambda: self.build_messages(test_case, prompt, image_root_path))
+        return self.format_result(test_case=test_case, prompt=prompt, **outcome)
+
+    async def agenerate_answer(self, test_case: Dict, image_root_path: str = "") -> Dict[str, Any]:
+        prompt = self.format_prompt(test_case)
+        outcome = await self._acomplete(lambda: self.build_messages(test_case, prompt, image_root_path))
+        return self.format_result(test_case=test_case, prompt=prompt, **outcome)
+
+    # --- several questions on one document per request --------------------------------
+
+    def build_multi_question_messages(self, test_cases: List[Dict]) -> List[Dict]:
+        """
+        One request for several cases on the same document, pages and task: instructions
+        and examples once, the document once, then the numbered questions.
+        """
+        parts = self.format_prefix_prompt(test_cases[0], question_ref="each numbered QUESTION in the last message")
+        stable = [{"role": "system", "content": parts["instructions"]}]
+        if parts["examples"]:
+            stable.append({"role": "user", "content": parts["examples"]})
+        numbered = "\n".join(f"{i}. {case['test_case']['question']}" for i, case in enumerate(test_cases, 1))
+        questions = {"role": "user", "content": f"QUESTIONS:\n{numbered}\n\n{MULTI_QUESTION_FORMAT}"}
+
+        document = {"role": "user", "content": self.pack_context(test_cases[0], stable + [questions])}
+        for case in test_cases[1:]:
+            case["test_case"]["input"]["context_packing"] = test_cases[0]["test_case"]["input"]["context_packing"]
+        if self.prompt_layout == "paper_first":
+            return [document] + stable + [questions]
+        return stable + [document, questions]
+
+    @staticmethod
+    def split_answers(predicted_answer: str, count: int) -> List[Optional[str]]:
+        """
+        The <Answer> blocks of a multi-question response, by question number. Blocks are
+        matched by the number written before them, or by position when all count blocks
+        are present without usable numbers; missing answers are None.
+        """
+        blocks = list(ANSWER_BLOCK.finditer(str(predicted_answer)))
+        answers = [None] * count
+        previous_end = 0
+        numbered = {}
+        for block in blocks:
+            labels = QUESTION_NUMBER.findall(predicted_answer[previous_end:block.start()])
+            previous_end = block.end()
+            if labels and 1 <= int(labels[-1]) <= count and int(labels[-1]) not in numbered:
+                numbered[int(labels[-1])] = block.group(1)
+        if len(numbered) == len(blocks):
+            for number, answer in numbered.items():
+                answers[number - 1] = answer
+        elif len(blocks) == count:
+            answers = [block.group(1) for block in blocks]
+        return [f"<Answer> {answer.strip()} </Answer>" if answer is not None else None for answer in answers]
+
+    def split_results(self, test_cases: List[Dict], outcome: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Per-case format_result records of one multi-question outcome; usage is shared out evenly."""
+        count = len(test_cases)
+        answers = [None] * count if outcome["error"] else self.split_answers(outcome["predicted_answer"], count)
+        total = outcome["token_count"]
+        results = []
+        for i, (case, answer) in enumerate(zip(test_cases, answers)):
+            share = {key: value // count + (1 if i < value % count else 0) for key, value in total.items()}
+            error = outcome["error"]
+            if error is None and answer is None:
+                error = {"kind": "unknown", "status_code": None, "retry_after": None,
+                         "message": f"answer {i + 1} of {count} missing from the batched response"}
+            result = self.format_result(
+                test_case=case,
+                predicted_answer=answer if answer is not None else "error",
+                prompt=self.format_prompt(case),
+                response_time=outcome["response_time"],
+                token_count=share,
+                error=error,
+                cache_hit=outcome["cache_hit"]
+            )
+            result["question_batch"] = {"size": count, "position": i + 1, "token_count": total}
+            results.append(result)
+        return results
+
+    def generate_answers(self, test_cases: List[Dict]) -> List[Dict[str, Any]]:
+        outcome = self._complete(lambda: self.build_multi_question_messages(test_cases))
+        return self.split_results(test_cases, outcome)
+
+    async def agenerate_answers(self, test_cases: List[Dict]) -> List[Dict[str, Any]]:
+        outcome = await self._acomplete(lambda: self.build_multi_question_messages(test_cases))
+        return self.split_results(test_cases, outcome)
@@ -0,0 +1,239 @@
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.types.TestCase import TestCase, TestCaseMetadata, TaskCategory, DifficultyType
+
+# File layout (little endian):
+#   header   : MAGIC, format version, length of the JSON table block
+#   tables   : JSON with the shared tables (tasks, categories, difficulties, notes,
+#              few-shot tables, ...) and the case_id list, each stored once
+#   offsets  : one (offset, length) pair per case into the record blob
+#   records  : one compact JSON array per case holding codes into the tables
+MAGIC = b"MBQC"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sIQ")
+_OFFSET = struct.Struct("<QI")
+
+
+class _Table:
+    """Value -> code table that keeps insertion order."""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value) -> int:
+        key = json.dumps(value, sort_keys=True, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+        if key not in self._codes:
+            self._codes[key] = len(self.values)
+            self.values.append(value)
+        return self._codes[key]
+
+
+def write_compact_corpus(cases_by_task: Dict[str, List[Dict]], path: str,
+                         signature: Optional[Any] = None) -> int:
+    """
+    Convert benchmark cases ({task: [case dict]}) into the compact corpus format.
+    Notes, few-shot tables, categories, difficulties and other repeated strings are stored
+    once; every case keeps only small integer codes for them.
+
+    Returns:
+        Number of cases written.
+    """
+    tables = {name: _Table() for name in
+              ("tasks", "categories", "subcategories", "difficulties", "versions",
+               "answer_types", "notes", "few_shot_tables")}
+    case_ids = []
+    records = []
+
+    for data_name, test_cases in cases_by_task.items():
+        task_code = tables["tasks"].code(data_name)
+        for case in test_cases:
+            test_case = case["test_case"]
+            case_input = test_case["input"]
+            case_ids.append(case["case_id"])
+            records.append([
+                task_code,
+                tables["categories"].code(case.get("task_category", "")),
+                tables["subcategories"].code(case.get("task_subcategory", "")),
+                tables["difficulties"].code(case.get("difficulty", "")),
+                tables["versions"].code(case.get("version", "1.0")),
+                case.get("timestamp", ""),
+                case_input,
+                test_case["question"],
+                tables["notes"].code(test_case.get("note", "")),
+                tables["few_shot_tables"].code(test_case.get("few_shot_examples", [])),
+                tables["answer_types"].code(test_case.get("expected_answer_type", "")),
+                test_case["expected_answer"],
+            ])
+
+    table_block = json.dumps({
+        "signature": signature,
+        "case_ids": case_ids,
+        **{name: table.values for name, table in tables.items()},
+    }, ensure_ascii=False).encode("utf-8")
+
+    blobs = [json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for record in records]
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(table_block)))
+        f.write(table_block)
+        offset = 0
+        for blob in blobs:
+            f.write(_OFFSET.pack(offset, len(blob)))
+            offset += len(blob)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def convert_benchmarks(benchmark_folder: str = "benchmarks", path: str = "src/data/benchmark.mbqc",
+                       signature: Optional[Any] = None) -> int:
+    """Convert every <task>.json in benchmark_folder into one compact corpus file."""
+    cases_by_task = {}
+    for file_name in sorted(os.listdir(benchmark_folder)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(benchmark_folder, file_name), "r", encoding="utf-8") as f:
+                cases_by_task[file_name[:-len(".json")]] = json.load(f)
+    return write_compact_corpus(cases_by_task, path, signature)
+
+
+class CompactCorpus:
+    """
+    Read-only view of a compact corpus file. The file is memory-mapped, so worker
+    processes opening the same corpus share one copy through the page cache; a case is
+    decoded only when it is accessed, and shared notes and few-shot tables are the same
+    Python objects for every case that uses them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, table_len = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Not a compact corpus (format {FORMAT_VERSION}): {path}")
+
+        tables = json.loads(self._mmap[_HEADER.size:_HEADER.size + table_len].decode("utf-8"))
+        self.signature = tables["signature"]
+        self.case_ids = tables["case_ids"]
+        self.tasks = tables["tasks"]
+        self.notes = tables["notes"]
+        self.few_shot_tables = tables["few_shot_tables"]
+        self.subcategories = tables["subcategories"]
+        self.versions = tables["versions"]
+        self.answer_types = tables["answer_types"]
+        self.categories = tables["categories"]
+        self.difficulties = tables["difficulties"]
+
+        # Enum-coded views of the category and difficulty tables
+        self.category_enums = [self._to_enum(TaskCategory.from_label, value) for value in self.categories]
+        self.difficulty_enums = [self._to_enum(DifficultyType, value) for value in self.difficulties]
+
+        self._offsets_start = _HEADER.size + table_len
+        self._records_start = self._offsets_start + _OFFSET.size * len(self.case_ids)
+        self._position = {case_id: i for i, case_id in enumerate(self.case_ids)}
+
+    @staticmethod
+    def _to_enum(convert, value):
+        try:
+            return convert(value)
+        except ValueError:
+            return value
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.case_ids)
+
+    def __contains__(self, case_id) -> bool:
+        return case_id in self._position
+
+    def index_of(self, case_id: str) -> int:
+        return self._position[case_id]
+
+    def _record(self, i: int) -> list:
+        offset, length = _OFFSET.unpack_from(self._mmap, self._offsets_start + i * _OFFSET.size)
+        start = self._records_start + offset
+        return json.loads(self._mmap[start:start + length].decode("utf-8"))
+
+    def task_of(self, i: int) -> str:
+        return self.tasks[self._record(i)[0]]
+
+    def case_dict(self, i: int) -> Dict[str, Any]:
+        """Case i in the benchmark JSON layout (the form Pipeline and the adapters consume)."""
+        return self._case_dict(i, self._record(i))
+
+    def _case_dict(self, i: int, record: list) -> Dict[str, Any]:
+        (task, category, subcategory, difficulty, version, timestamp, case_input,
+         question, note, few_shot, answer_type, expected_answer) = record
+        return {
+            "case_id": self.case_ids[i],
+            "version": self.versions[version],
+            "timestamp": timestamp,
+            "difficulty": self.difficulties[difficulty],
+            "task_category": self.categories[category],
+            "task_subcategory": self.subcategories[subcategory],
+            "test_case": {
+                "input": case_input,
+                "question": question,
+                "note": self.notes[note],
+                "few_shot_examples": self.few_shot_tables[few_shot],
+                "expected_answer_type": self.answer_types[answer_type],
+                "expected_answer": expected_answer
+            }
+        }
+
+    def case(self, i: int) -> TestCaseMetadata:
+        """Case i as a slotted TestCaseMetadata with enum-coded category and difficulty."""
+        (task, category, subcategory, difficulty, version, timestamp, case_input,
+         question, note, few_shot, answer_type, expected_answer) = self._record(i)
+        return TestCaseMetadata(
+            case_id=self.case_ids[i],
+            source="",
+            task_category=self.category_enums[category],
+            task_subcategory=self.subcategories[subcategory],
+            test_case=TestCase(
+                input=case_input,
+                question=question,
+                note=self.notes[note],
+                expected_answer_type=self.answer_types[answer_type],
+                expected_answer=expected_answer,
+                few_shot_examples=self.few_shot_tables[few_shot]
+            ),
+            difficulty=self.difficulty_enums[difficulty],
+            version=self.versions[version],
+            timestamp=timestamp
+        )
+
+    def iter_cases(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(task, case dict) of every case in file order, one record decoded at a time."""
+        for i in range(len(self)):
+            record = self._record(i)
+            yield self.tasks[record[0]], self._case_dict(i, record)
+
+    def cases_by_task(self) -> Dict[str, List[Dict[str, Any]]]:
+        result = {task: [] for task in self.tasks}
+        for task, case in self.iter_cases():
+            result[task].append(case)
+        return result
+
+    def __iter__(self) -> Iterator[TestCaseMetadata]:
+        for i in range(len(self)):
+            yield self.case(i)
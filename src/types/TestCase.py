@@ -3,7 +3,7 @@ import os
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Any
 from pathlib import Path
 
 from enum import Enum
@@ -15,6 +15,18 @@ class TaskCategory(str, Enum):
     ADVANCED_SEMANTIC_REASONING = "Complex Semantic Reasoning"        # Advanced inference tasks
     LAYOUT_ANALYSIS = "Layout Structure and Semantic Region Recognition "  # Document layout and semantic segmentation
 
+    @classmethod
+    def from_label(cls, label: str):
+        """
+        Match a category label ignoring case and surrounding spaces (the benchmark mixes
+        capitalisations, and the layout value keeps its historical trailing space).
+        """
+        key = str(label).strip().lower()
+        for member in cls:
+            if member.value.strip().lower() == key:
+                return member
+        raise ValueError(f"Unknown task category: {label}")
+
 # Subcategories for structured information extraction
 class StructInfoSubcategory(str, Enum):
     STRAIN_NAME_NORMALIZATION = "Strain Entity Recognition and Normalization"  # Recognizing and normalizing strain names
@@ -60,16 +72,38 @@ class DifficultyType(str, Enum):
     Hard = "Hard"
 
 # Test case definition, including inputs and expected outputs
-@dataclass
+@dataclass(slots=True)
 class TestCase:
     input: Dict[str, any]  # Contains fields like paper_id, image_path, is_full_pdf
     question: str
     note: str
     expected_answer_type: str
     expected_answer: str
+    few_shot_examples: List[Dict[str, str]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "input": dict(self.input),
+            "question": self.question,
+            "note": self.note,
+            "few_shot_examples": self.few_shot_examples,
+            "expected_answer_type": self.expected_answer_type,
+            "expected_answer": self.expected_answer
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TestCase":
+        return cls(
+            input=data["input"],
+            question=data["question"],
+            note=data.get("note", ""),
+            expected_answer_type=data.get("expected_answer_type", ""),
+            expected_answer=data["expected_answer"],
+            few_shot_examples=data.get("few_shot_examples", [])
+        )
 
 # Metadata wrapper for each test case, including task and version info
-@dataclass
+@dataclass(slots=True)
 class TestCaseMetadata:
     case_id: str
     source: str
@@ -80,17 +114,34 @@ class TestCaseMetadata:
     version: str = "1.0"
     timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
 
-    # Serialize test case to JSON, optionally save to file
-    def to_json(self, file_path: Optional[str] = None) -> str:
-        data = {
+    # Plain dict in the benchmark JSON layout, as consumed by Pipeline and the adapters
+    def to_dict(self) -> Dict[str, Any]:
+        return {
             "case_id": self.case_id,
             "version": self.version,
             "timestamp": self.timestamp,
-            "difficulty": self.difficulty,
-            "task_category": self.task_category,
+            "difficulty": self.difficulty.value if isinstance(self.difficulty, Enum) else self.difficulty,
+            "task_category": self.task_category.value if isinstance(self.task_category, Enum) else self.task_category,
             "task_subcategory": self.task_subcategory,
-            "test_case": self.test_case
+            "test_case": self.test_case.to_dict()
         }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TestCaseMetadata":
+        return cls(
+            case_id=data["case_id"],
+            source=data.get("source", ""),
+            task_category=TaskCategory.from_label(data["task_category"]),
+            task_subcategory=data["task_subcategory"],
+            test_case=TestCase.from_dict(data["test_case"]),
+            difficulty=DifficultyType(data["difficulty"]),
+            version=data.get("version", "1.0"),
+            timestamp=data.get("timestamp", "")
+        )
+
+    # Serialize test case to JSON, optionally save to file
+    def to_json(self, file_path: Optional[str] = None) -> str:
+        data = self.to_dict()
         if file_path:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             with open(file_path, 'w', encoding='utf-8') as f:
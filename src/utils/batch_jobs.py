@@ -0,0 +1,177 @@
+import io
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_body(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Request body of one batch line: the create() kwargs with extra_body merged in, as sent on the wire."""
+    body = {k: v for k, v in request.items() if k != "extra_body"}
+    body.update(request.get("extra_body") or {})
+    return body
+
+
+class BatchJobRunner:
+    """
+    Runs chat-completions requests of one adapter through the provider's batch API
+    (OpenAI, and DashScope in compatible mode, share the format): render JSONL, upload,
+    create the job, poll until it is final, then read the output and error files.
+
+    Every submitted job is remembered in state_dir/<batch_id>.json, so a run that stops
+    while a job is still being processed picks it up again instead of paying twice.
+    """
+
+    def __init__(self, adapter, state_dir: str, poll_interval: float = 30.0,
+                 max_requests: int = 50000, max_bytes: int = 100 * 1024 * 1024,
+                 completion_window: str = "24h"):
+        """
+        Args:
+            adapter: A ChatCompletionModel with supports_batch set.
+            state_dir: batch_jobs/<model> directory for the job states.
+            max_requests, max_bytes: Split the requests into several jobs above these
+                (OpenAI accepts up to 50,000 requests and 200 MB per input file).
+        """
+        if not getattr(adapter, "supports_batch", False):
+            raise ValueError(f"{type(adapter).__name__} cannot be run through a batch API")
+        self.adapter = adapter
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.completion_window = completion_window
+        os.makedirs(state_dir, exist_ok=True)
+
+    # --- job state -------------------------------------------------------------------
+
+    def _state_path(self, batch_id: str) -> str:
+        return os.path.join(self.state_dir, f"{batch_id}.json")
+
+    def _save_state(self, job: Dict[str, Any]) -> None:
+        tmp_path = f"{self._state_path(job['batch_id'])}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._state_path(job["batch_id"]))
+
+    def unfinished_jobs(self) -> List[Dict[str, Any]]:
+        """Jobs submitted earlier whose results were not ingested yet."""
+        jobs = []
+        for file_name in sorted(os.listdir(self.state_dir)):
+            if file_name.endswith(".json"):
+                with open(os.path.join(self.state_dir, file_name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                if not job.get("ingested"):
+                    jobs.append(job)
+        return jobs
+
+    def mark_ingested(self, job: Dict[str, Any]) -> None:
+        job["ingested"] = True
+        self._save_state(job)
+
+    # --- submit ----------------------------------------------------------------------
+
+    def _chunks(self, lines: List[Tuple[str, bytes]]) -> Iterator[List[Tuple[str, bytes]]]:
+        chunk, size = [], 0
+        for custom_id, line in lines:
+            if chunk and (len(chunk) >= self.max_requests or size + len(line) > self.max_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append((custom_id, line))
+            size += len(line)
+        if chunk:
+            yield chunk
+
+    def submit(self, requests: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Submit (custom_id, create() kwargs) pairs, split into as many jobs as the limits need.
+
+        Returns:
+            The job states, one per submitted batch.
+        """
+        lines = []
+        for custom_id, request in requests:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": batch_body(request)}
+            lines.append((custom_id, (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")))
+
+        jobs = []
+        for chunk in self._chunks(lines):
+            payload = b"".join(line for _, line in chunk)
+            input_file = self.adapter.client.files.create(
+                file=("batch_input.jsonl", io.BytesIO(payload)), purpose="batch")
+            batch = self.adapter.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=self.completion_window,
+            )
+            job = {
+                "batch_id": batch.id,
+                "input_file_id": input_file.id,
+                "model_name": self.adapter.model_name,
+                "case_ids": [custom_id for custom_id, _ in chunk],
+                "status": batch.status,
+                "submitted_at": time.time(),
+                "ingested": False,
+            }
+            self._save_state(job)
+            print(f"📦 Submitted batch {batch.id} with {len(chunk)} requests ({len(payload) / 1e6:.1f} MB)")
+            jobs.append(job)
+        return jobs
+
+    # --- poll and read ---------------------------------------------------------------
+
+    def wait(self, job: Dict[str, Any], timeout: Optional[float] = None):
+        """Poll until the job is final; returns the provider's batch object."""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            batch = self.adapter.client.batches.retrieve(job["batch_id"])
+            if batch.status != job.get("status"):
+                counts = batch.request_counts
+                progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+                print(f"📦 Batch {job['batch_id']}: {batch.status}{progress}")
+                job["status"] = batch.status
+                self._save_state(job)
+            if batch.status in FINAL_STATUSES:
+                job["output_file_id"] = batch.output_file_id
+                job["error_file_id"] = batch.error_file_id
+                job["finished_at"] = time.time()
+                self._save_state(job)
+                return batch
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"Batch {job['batch_id']} still {batch.status} after {timeout}s")
+            time.sleep(self.poll_interval)
+
+    def _file_lines(self, file_id: Optional[str]) -> Iterator[Dict[str, Any]]:
+        if not file_id:
+            return
+        for line in self.adapter.client.files.content(file_id).text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+    def results(self, job: Dict[str, Any]) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        """
+        (custom_id, chat.completion body, error) for every request of a final job;
+        exactly one of body and error is set.
+        """
+        seen = set()
+        for record in list(self._file_lines(job.get("output_file_id"))) + list(self._file_lines(job.get("error_file_id"))):
+            custom_id = record.get("custom_id")
+            response = record.get("response") or {}
+            seen.add(custom_id)
+            if response.get("status_code") == 200 and not record.get("error"):
+                yield custom_id, response.get("body"), None
+            else:
+                error = record.get("error") or (response.get("body") or {}).get("error") or {}
+                yield custom_id, None, {
+                    "kind": "batch",
+                    "status_code": response.get("status_code"),
+                    "retry_after": None,
+                    "message": str(error.get("message", error))[:500],
+                }
+        for custom_id in job["case_ids"]:
+            if custom_id not in seen:
+                # Expired or cancelled jobs leave requests without any line
+                yield custom_id, None, {"kind": "batch", "status_code": None, "retry_after": None,
+                                        "message": f"no result, batch {job.get('status')}"}
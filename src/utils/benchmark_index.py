@@ -0,0 +1,240 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+from collections import deque
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.types.CompactCorpus import CompactCorpus, write_compact_corpus
+
+
+def shard_of(case_id: str, num_shards: int) -> int:
+    """Stable shard number of a case: the same on every node, Python version and run."""
+    return int(hashlib.sha1(str(case_id).encode("utf-8")).hexdigest(), 16) % num_shards
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse an "i/N" shard spec (0 <= i < N)."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got: {spec}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must satisfy 0 <= i < N, got: {spec}")
+    return index, count
+
+
+class _CorpusCases(Mapping):
+    """case_id -> case dict, decoded from the memory-mapped corpus on every access."""
+
+    def __init__(self, corpus: CompactCorpus):
+        self.corpus = corpus
+
+    def __getitem__(self, case_id: str) -> Dict:
+        return self.corpus.case_dict(self.corpus.index_of(case_id))
+
+    def __contains__(self, case_id) -> bool:
+        return case_id in self.corpus
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.corpus.case_ids)
+
+    def __len__(self) -> int:
+        return len(self.corpus)
+
+
+class BenchmarkIndex:
+    """
+    All benchmark cases parsed once and indexed by case_id, task, difficulty, pdf and page.
+
+    Completion is tracked per model: a model's pending cases of each task sit in a queue,
+    so picking the next batch costs O(batch) instead of re-reading task and result files.
+    """
+
+    def __init__(self, cases_by_task: Optional[Dict[str, List[Dict]]] = None,
+                 corpus: Optional[CompactCorpus] = None):
+        """
+        Args:
+            cases_by_task: {task: [case dict]} parsed from the benchmark files, kept in memory.
+            corpus: Compact corpus to index instead. Only ids are indexed and cases are decoded
+                from the shared mapping when they are handed out; the corpus stays open until close().
+        """
+        self.corpus = corpus
+        self.by_id = _CorpusCases(corpus) if corpus is not None else {}
+        self.task_of = {}
+        self.by_task = {}
+        self.by_difficulty = {}
+        self.by_pdf = {}
+        self.by_page = {}  # (pdf_index, image_index) -> [case_id]
+        self.by_document = {}  # (task, pdf_index, pages, task_subcategory) -> [case_id]
+
+        if corpus is not None:
+            for data_name, case in corpus.iter_cases():
+                self._add(data_name, case)
+        else:
+            for data_name, test_cases in (cases_by_task or {}).items():
+                self.by_task.setdefault(data_name, [])
+                for case in test_cases:
+                    self.by_id[case.get("case_id")] = case
+                    self._add(data_name, case)
+
+        self._pending = {}  # model_name -> {data_name: deque[case_id]}, may hold stale ids
+        self._queued = {}  # model_name -> {data_name: set[case_id]}, the ids actually waiting
+        self._done = {}  # model_name -> set[case_id]
+        self._lock = threading.Lock()
+
+    def _add(self, data_name: str, case: Dict) -> None:
+        case_id = case.get("case_id")
+        self.task_of[case_id] = data_name
+        self.by_task.setdefault(data_name, []).append(case_id)
+        self.by_difficulty.setdefault(case.get("difficulty"), []).append(case_id)
+        self.by_document.setdefault(self.document_key(data_name, case), []).append(case_id)
+
+        case_input = case["test_case"]["input"]
+        image_index = case_input.get("image_index", [])
+        if isinstance(image_index, str):
+            image_index = [image_index] if image_index else []
+        for pdf_index in case_input.get("pdf_index", "").split(","):
+            self.by_pdf.setdefault(pdf_index, []).append(case_id)
+            for page in image_index:
+                self.by_page.setdefault((pdf_index, page), []).append(case_id)
+
+    def close(self) -> None:
+        if self.corpus is not None:
+            self.corpus.close()
+
+    @staticmethod
+    def document_key(data_name: str, case: Dict) -> Tuple:
+        """Cases with the same key ask about the same pages with the same instructions."""
+        case_input = case["test_case"]["input"]
+        image_index = case_input.get("image_index", [])
+        pages = tuple(image_index) if isinstance(image_index, list) else (image_index,)
+        return data_name, case_input.get("pdf_index", ""), pages, case.get("task_subcategory")
+
+    @property
+    def tasks(self) -> List[str]:
+        return list(self.by_task)
+
+    @staticmethod
+    def _signature(benchmark_folder: str, file_names: List[str]):
+        signature = []
+        for file_name in file_names:
+            stat = os.stat(os.path.join(benchmark_folder, file_name))
+            signature.append([file_name, stat.st_size, stat.st_mtime_ns])  # JSON-friendly, stored in the snapshot
+        return signature
+
+    @classmethod
+    def load(cls, benchmark_folder: str = "benchmarks", snapshot_path: Optional[str] = None) -> "BenchmarkIndex":
+        """
+        Parse every <task>.json in benchmark_folder, or read the compact corpus snapshot at
+        snapshot_path when it was built from the same files (name, size, mtime). A stale or
+        missing snapshot is rebuilt, so later runs and other processes can map it.
+        """
+        file_names = sorted(f for f in os.listdir(benchmark_folder) if f.endswith(".json"))
+        signature = cls._signature(benchmark_folder, file_names)
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                corpus = CompactCorpus(snapshot_path)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable benchmark snapshot {snapshot_path}: {e}")
+            else:
+                if corpus.signature == signature:
+                    return cls(corpus=corpus)
+                corpus.close()
+
+        cases_by_task = {}
+        for file_name in file_names:
+            with open(os.path.join(benchmark_folder, file_name), "r", encoding="utf-8") as f:
+                cases_by_task[file_name[:-len(".json")]] = json.load(f)
+
+        if snapshot_path:
+            write_compact_corpus(cases_by_task, snapshot_path, signature)
+            # Served from the mapping like a snapshot hit, the parsed files are dropped
+            return cls(corpus=CompactCorpus(snapshot_path))
+        return cls(cases_by_task)
+
+    def start_tracking(self, model_name: str, done_case_ids: Iterable[str], shuffle: bool = True,
+                       seed: int = 0, shard: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Queue every case of every task that model_name has not answered yet.
+
+        Args:
+            shuffle: Randomise the order within each task; seeded by (seed, model_name),
+                so reruns and other nodes see the same order.
+            shard: (i, N) to keep only the cases whose stable case_id hash falls in shard i.
+        """
+        done = set(done_case_ids)
+        rng = random.Random(f"{seed}:{model_name}")
+        pending = {}
+        for data_name, case_ids in self.by_task.items():
+            queue = [case_id for case_id in case_ids if case_id not in done]
+            if shard is not None:
+                queue = [case_id for case_id in queue if shard_of(case_id, shard[1]) == shard[0]]
+            if shuffle:
+                rng.shuffle(queue)
+            pending[data_name] = deque(queue)
+        with self._lock:
+            self._done[model_name] = done
+            self._pending[model_name] = pending
+            self._queued[model_name] = {data_name: set(queue) for data_name, queue in pending.items()}
+
+    def next_batch(self, model_name: str, data_name: str, size: int) -> List[Dict]:
+        """
+        Hand out up to size unanswered cases of one task. Cases are deep copies, since
+        pipelines write OCR text into them and several models may run at once.
+        """
+        batch = []
+        with self._lock:
+            queue = self._pending[model_name].get(data_name, deque())
+            queued = self._queued[model_name].get(data_name, set())
+            done = self._done[model_name]
+            while queue and len(batch) < size:
+                case_id = queue.popleft()
+                if case_id not in queued:
+                    continue  # already handed out by take_siblings
+                queued.discard(case_id)
+                if case_id not in done:
+                    batch.append(case_id)
+        return [copy.deepcopy(self.by_id[case_id]) for case_id in batch]
+
+    def take_siblings(self, model_name: str, case_id: str, limit: int) -> List[Dict]:
+        """
+        Hand out up to limit more pending cases on the same document, pages and task as
+        case_id, so they can be asked together.
+        """
+        data_name = self.task_of[case_id]
+        key = self.document_key(data_name, self.by_id[case_id])
+        taken = []
+        with self._lock:
+            queued = self._queued[model_name].get(data_name, set())
+            done = self._done[model_name]
+            for sibling in self.by_document.get(key, []):
+                if len(taken) >= limit:
+                    break
+                if sibling != case_id and sibling not in done and sibling in queued:
+                    queued.discard(sibling)  # its deque entry is skipped by next_batch
+                    taken.append(sibling)
+        return [copy.deepcopy(self.by_id[sibling]) for sibling in taken]
+
+    def mark_done(self, model_name: str, case_id: str) -> None:
+        with self._lock:
+            self._done[model_name].add(case_id)
+
+    def release(self, model_name: str, case_id: str) -> None:
+        """Put a handed-out case that failed back at the end of its task queue."""
+        with self._lock:
+            data_name = self.task_of[case_id]
+            queued = self._queued[model_name][data_name]
+            if case_id not in self._done[model_name] and case_id not in queued:
+                self._pending[model_name][data_name].append(case_id)
+                queued.add(case_id)
+
+    def remaining(self, model_name: str, data_name: Optional[str] = None) -> int:
+        with self._lock:
+            queued = self._queued[model_name]
+            sets = [queued.get(data_name, set())] if data_name else queued.values()
+            return sum(len(ids) for ids in sets)
@@ -0,0 +1,142 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+DEFAULT_BUDGET = {
+    "context_window": 32768,  # tokens the model accepts, prompt and answer together
+    "max_output_tokens": 4096,  # kept free for the answer
+    "tokenizer": "chars",  # tiktoken:<encoding> | hf:<tokenizer repo or path> | chars (about 4 chars per token)
+}
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators of one chat message
+TRUNCATION_MARKER = "[... {dropped} tokens truncated]"
+
+_budgets = {}
+_tokenizers = {}
+_registry_lock = threading.Lock()
+
+
+class Tokenizer:
+    """Token counting and truncation with the target model's tokenizer."""
+
+    def __init__(self, spec: str = "chars"):
+        self.spec = spec
+        self._encode, self._decode = self._load(spec)
+
+    @staticmethod
+    def _load(spec: str):
+        kind, _, name = spec.partition(":")
+        try:
+            if kind == "tiktoken":
+                import tiktoken
+                encoding = tiktoken.get_encoding(name or "o200k_base")
+                return encoding.encode, encoding.decode
+            if kind == "hf":
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                return (lambda text: tokenizer.encode(text, add_special_tokens=False),
+                        lambda ids: tokenizer.decode(ids, skip_special_tokens=True))
+        except Exception as e:
+            print(f"⚠️ Tokenizer {spec} unavailable ({e}), estimating about 4 characters per token")
+        return None, None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encode is None:
+            return len(text) // 4 + 1
+        return len(self._encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text within max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self._encode is None:
+            return text[:max_tokens * 4]
+        ids = self._encode(text)
+        return text if len(ids) <= max_tokens else self._decode(ids[:max_tokens])
+
+
+def configure_context_budgets(budgets: Optional[Dict[str, Dict[str, Any]]]) -> None:
+    """
+    Set per-model context budgets, usually the context_budgets section of config.yaml:
+        {model_name: {"context_window": ..., "max_output_tokens": ..., "tokenizer": ...}}
+    The "default" entry applies to models that are not listed.
+    """
+    with _registry_lock:
+        _budgets.clear()
+        for model_name, budget in (budgets or {}).items():
+            _budgets[model_name] = budget or {}
+
+
+def get_tokenizer(spec: str) -> Tokenizer:
+    """Tokenizers are loaded once per spec and shared by every adapter."""
+    with _registry_lock:
+        if spec not in _tokenizers:
+            _tokenizers[spec] = Tokenizer(spec)
+        return _tokenizers[spec]
+
+
+def get_context_packer(model_name: str) -> "ContextPacker":
+    with _registry_lock:
+        budget = {**DEFAULT_BUDGET, **_budgets.get("default", {}), **_budgets.get(model_name, {})}
+    return ContextPacker(get_tokenizer(budget["tokenizer"]), budget["context_window"], budget["max_output_tokens"])
+
+
+def serialize_pages(pages: Union[Dict[Any, str], str]) -> str:
+    """
+    Compact prompt form of OCR output: "[Page n]" headers instead of a Python dict repr,
+    with runs of spaces and blank lines collapsed.
+    """
+    if not isinstance(pages, dict):
+        return _compact(str(pages))
+    parts = []
+    for page, text in pages.items():
+        text = _compact(str(text))
+        if text:
+            parts.append(f"[Page {page}]\n{text}")
+    return "\n\n".join(parts)
+
+
+def _compact(text: str) -> str:
+    text = re.sub(r"[ \t ]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+class ContextPacker:
+    """
+    Fits document text into what is left of a model's context window once the fixed
+    messages (system prompt, few-shot examples) and the answer budget are reserved.
+    Pages are kept whole in reading order; the page that crosses the budget is cut at a
+    token boundary and the rest dropped, with a marker telling the model text is missing.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, context_window: int, max_output_tokens: int):
+        self.tokenizer = tokenizer
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+
+    def budget(self, fixed_messages: List[Dict]) -> int:
+        fixed = sum(self.tokenizer.count(str(m.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+                    for m in fixed_messages)
+        return self.context_window - self.max_output_tokens - fixed - MESSAGE_OVERHEAD_TOKENS
+
+    def pack(self, pages: Union[Dict[Any, str], str], fixed_messages: List[Dict],
+             prefix: str = "") -> Tuple[str, Dict[str, int]]:
+        """
+        Returns:
+            (text, stats) where stats holds the tokens of the packed document text, the
+            tokens dropped to fit and the budget that applied.
+        """
+        budget = self.budget(fixed_messages) - self.tokenizer.count(prefix)
+        text = serialize_pages(pages)
+        total = self.tokenizer.count(text)
+        if total <= budget:
+            return prefix + text, {"context_tokens": total, "dropped_tokens": 0, "budget_tokens": budget}
+
+        marker_tokens = self.tokenizer.count(TRUNCATION_MARKER.format(dropped=total))
+        kept = self.tokenizer.truncate(text, max(0, budget - marker_tokens))
+        kept_tokens = self.tokenizer.count(kept)
+        dropped = total - kept_tokens
+        packed = f"{kept}\n{TRUNCATION_MARKER.format(dropped=dropped)}" if kept else TRUNCATION_MARKER.format(dropped=dropped)
+        return prefix + packed, {"context_tokens": kept_tokens, "dropped_tokens": dropped, "budget_tokens": budget}
@@ -0,0 +1,218 @@
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from src.utils.rate_limiter import DEFAULT_BASE_URL
+from src.utils.replay import AsyncReplayTransport, Recorder, ReplayTransport
+
+DEFAULT_POOL = {
+    "max_connections": 256,  # per endpoint and key, shared by every pipeline using it
+    "max_keepalive_connections": 64,
+    "keepalive_expiry": 120.0,  # seconds an idle connection is kept open
+    "http2": True,  # many streams over one TLS connection; needs the optional h2 package
+    "connect_timeout": 10.0,
+    "timeout": 600.0,  # read/write/pool timeout, long enough for slow reasoning models
+    "record_path": None,  # record mode: append chat completions to this JSONL file
+    "redirect_url": None,  # replay mode: send every request to this mock server instead
+}
+
+_pool_config = dict(DEFAULT_POOL)
+_sync_clients = {}  # (base_url, api_key) -> httpx.Client
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {(base_url, api_key): httpx.AsyncClient}
+_stats = []  # one PoolStats per pool, merged per endpoint by pool_stats()
+_recorder = None
+_registry_lock = threading.Lock()
+
+
+class PoolStats:
+    """
+    In-flight accounting of one endpoint pool. A request counts as in flight until its
+    response headers arrive; requests that start while every connection slot is taken
+    are counted as saturated, they wait for a free connection.
+    """
+
+    def __init__(self, base_url: str, max_connections: int):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.max_connections:
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "max_connections": self.max_connections,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturated": self.saturated,
+        }
+
+
+class _CountingTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.start()
+        try:
+            return self._transport.handle_request(request)
+        finally:
+            self._stats.finish()
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class _AsyncCountingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.start()
+        try:
+            return await self._transport.handle_async_request(request)
+        finally:
+            self._stats.finish()
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def configure_http_pool(settings: Optional[Dict[str, Any]]) -> None:
+    """
+    Override the pool defaults, usually with the http_pool section of config.yaml.
+    Clients handed out before this call keep their old settings.
+    """
+    global _recorder
+    with _registry_lock:
+        _pool_config.clear()
+        _pool_config.update(DEFAULT_POOL)
+        _pool_config.update(settings or {})
+        _recorder = Recorder(_pool_config["record_path"]) if _pool_config["record_path"] else None
+
+
+def _http2_enabled() -> bool:
+    if not _pool_config["http2"]:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        print("⚠️ http2 is enabled but the h2 package is missing (pip install httpx[http2]), using HTTP/1.1")
+        _pool_config["http2"] = False
+        return False
+    return True
+
+
+def _key(base_url: str, api_key: str):
+    return (base_url or DEFAULT_BASE_URL).rstrip("/").lower(), api_key
+
+
+def _wrap(transport, replay_transport):
+    """Put the record/redirect layer of the current mode around a pooled transport."""
+    if _recorder is None and not _pool_config["redirect_url"]:
+        return transport
+    return replay_transport(transport, recorder=_recorder, redirect_url=_pool_config["redirect_url"])
+
+
+def _pool_settings(key) -> Dict[str, Any]:
+    """Transport and client arguments of a new pool; call with the registry lock held."""
+    stats = PoolStats(key[0], _pool_config["max_connections"])
+    _stats.append(stats)
+    return {
+        "stats": stats,
+        "limits": httpx.Limits(
+            max_connections=_pool_config["max_connections"],
+            max_keepalive_connections=_pool_config["max_keepalive_connections"],
+            keepalive_expiry=_pool_config["keepalive_expiry"],
+        ),
+        "http2": _http2_enabled(),
+        "timeout": httpx.Timeout(_pool_config["timeout"], connect=_pool_config["connect_timeout"]),
+    }
+
+
+def get_http_client(base_url: str, api_key: str) -> httpx.Client:
+    """The pooled client shared by every adapter that calls base_url with api_key."""
+    key = _key(base_url, api_key)
+    with _registry_lock:
+        if key not in _sync_clients:
+            settings = _pool_settings(key)
+            transport = _wrap(httpx.HTTPTransport(http2=settings["http2"], limits=settings["limits"]),
+                              ReplayTransport)
+            _sync_clients[key] = httpx.Client(
+                transport=_CountingTransport(transport, settings["stats"]),
+                timeout=settings["timeout"],
+                follow_redirects=True,
+            )
+        return _sync_clients[key]
+
+
+def get_async_http_client(base_url: str, api_key: str) -> httpx.AsyncClient:
+    """
+    The pooled async client for base_url and api_key on the running event loop.
+    Async connections belong to the loop that opened them, so every loop (one per
+    model thread in ManageModel) gets its own pool.
+    """
+    loop = asyncio.get_running_loop()
+    key = _key(base_url, api_key)
+    with _registry_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            settings = _pool_settings(key)
+            transport = _wrap(httpx.AsyncHTTPTransport(http2=settings["http2"], limits=settings["limits"]),
+                              AsyncReplayTransport)
+            clients[key] = httpx.AsyncClient(
+                transport=_AsyncCountingTransport(transport, settings["stats"]),
+                timeout=settings["timeout"],
+                follow_redirects=True,
+            )
+        return clients[key]
+
+
+async def aclose_http_clients() -> None:
+    """Close the async pools of the running loop; call before the loop shuts down."""
+    with _registry_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def close_http_clients() -> None:
+    with _registry_lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        client.close()
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint request counts, peak concurrency and saturation (keys are not exposed)."""
+    with _registry_lock:
+        stats = list(_stats)
+    merged = {}
+    for entry in stats:
+        record = merged.setdefault(entry.base_url, {**entry.as_dict(), "requests": 0, "in_flight": 0,
+                                                     "peak_in_flight": 0, "saturated": 0})
+        record["requests"] += entry.requests
+        record["in_flight"] += entry.in_flight
+        record["peak_in_flight"] = max(record["peak_in_flight"], entry.peak_in_flight)
+        record["saturated"] += entry.saturated
+    return merged
@@ -0,0 +1,310 @@
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from src.models.ocr.OcrCache import file_digest
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
+MIME_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif',
+              '.bmp': 'image/bmp', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # encoded payloads kept in memory per process
+DEFAULT_PROFILE = {
+    "format": "original",  # original (file bytes as rendered) | png | jpeg | webp
+    "max_edge": None,  # longest side in pixels, larger images are downscaled
+    "quality": 85,  # jpeg / webp quality
+    "grayscale": False,  # true | false | auto (only pages without colour, e.g. text pages)
+}
+GRAYSCALE_SATURATION = 12  # mean saturation (0-255) below which a page counts as colourless
+
+_indexes = {}
+_cache = None
+_profiles = {}
+_variant_dir = None
+_registry_lock = threading.Lock()
+
+
+class ImageIndex:
+    """
+    Page images under one root, scanned once: file stem ("S001_I003") -> path.
+    Lookups by id or by a fragment of the file name then cost a dictionary access.
+    """
+
+    def __init__(self, image_root_path: str):
+        self.image_root_path = image_root_path
+        self._files: List[Tuple[str, str]] = []  # (file name, path) in scan order
+        self._by_id: Dict[str, str] = {}
+        self._matches: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        for root, _, files in os.walk(image_root_path):
+            for file in files:
+                stem, ext = os.path.splitext(file)
+                if ext.lower() in IMAGE_EXTENSIONS:
+                    path = os.path.join(root, file)
+                    self._files.append((file, path))
+                    # A .png page wins over other renderings of the same id
+                    if stem not in self._by_id or ext.lower() == ".png":
+                        self._by_id[stem] = path
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def paths(self) -> List[str]:
+        return [path for _, path in self._files]
+
+    def get(self, image_id: str) -> Optional[str]:
+        """Path of an image id such as S001_I003, None if it is not under the root."""
+        return self._by_id.get(image_id)
+
+    def path(self, image_id: str, ext: str = ".png") -> str:
+        """Indexed path of image_id, else where it would be (files added after the scan)."""
+        return self._by_id.get(image_id) or os.path.join(self.image_root_path, f"{image_id}{ext}")
+
+    def matching(self, name: str) -> List[str]:
+        """Paths of every image whose file name contains name (e.g. the M001 of a case id)."""
+        with self._lock:
+            if name not in self._matches:
+                self._matches[name] = [path for file, path in self._files if name in file]
+            return list(self._matches[name])
+
+
+class EncodedImageCache:
+    """
+    LRU of encoded image payloads keyed by file digest and encoding variant, bounded by
+    the total size of the payloads. The same page asked about by many questions is read
+    and base64-encoded once; a changed file gets a new digest and is encoded again.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (digest, variant) -> payload
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_encode(self, image_path: str, variant: str = "png",
+                      encode: Optional[Callable[[str], str]] = None) -> str:
+        """
+        Payload of image_path for variant; encode(image_path) builds it on a miss
+        (default: base64 of the file bytes).
+        """
+        key = (file_digest(image_path), variant)
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            self.misses += 1
+        payload = (encode or encode_file)(image_path)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = payload
+                self._size += len(payload)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return payload
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+class ImageProfile:
+    """
+    How the images of one model are prepared: optional downscale to max_edge, grayscale,
+    and re-encoding to png / jpeg / webp. Re-encoded variants are written once under
+    <variant_dir>/<variant>/<sha256[:2]>/<sha256>.<format> and reused across runs.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, variant_dir: Optional[str] = None):
+        settings = {**DEFAULT_PROFILE, **(settings or {})}
+        self.format = str(settings["format"]).lower()
+        self.max_edge = settings["max_edge"]
+        self.quality = settings["quality"]
+        self.grayscale = settings["grayscale"]
+        self.variant_dir = variant_dir
+        if self.format not in ("original", "png", "jpeg", "webp"):
+            raise ValueError(f"Unsupported image format in profile: {self.format}")
+
+    @property
+    def is_original(self) -> bool:
+        return self.format == "original" and not self.max_edge and not self.grayscale
+
+    @property
+    def variant(self) -> str:
+        """Name of the encoded variant, part of every cache key."""
+        if self.is_original:
+            return "original"
+        parts = [self.format if self.format != "original" else "png"]
+        if parts[0] in ("jpeg", "webp"):
+            parts.append(f"q{self.quality}")
+        if self.max_edge:
+            parts.append(f"e{self.max_edge}")
+        if self.grayscale:
+            parts.append("gray" if self.grayscale is True else f"gray-{self.grayscale}")
+        return "-".join(parts)
+
+    def settings(self) -> Dict[str, Any]:
+        return {"format": self.format, "max_edge": self.max_edge, "quality": self.quality,
+                "grayscale": self.grayscale}
+
+    def mime_type(self, image_path: str) -> str:
+        if self.is_original:
+            return MIME_TYPES.get(os.path.splitext(image_path)[1].lower(), "image/png")
+        return MIME_TYPES[self.format if self.format != "original" else "png"]
+
+    def variant_path(self, digest: str) -> Optional[str]:
+        if self.variant_dir is None or self.is_original:
+            return None
+        extension = self.format if self.format != "original" else "png"
+        return os.path.join(self.variant_dir, self.variant, digest[:2], f"{digest}.{extension}")
+
+    def render(self, image_path: str) -> bytes:
+        """Encoded bytes of image_path under this profile."""
+        if self.is_original:
+            with open(image_path, 'rb') as f:
+                return f.read()
+        from PIL import Image, ImageStat
+
+        with Image.open(image_path) as image:
+            image = image.convert("RGB")
+            if self.max_edge and max(image.size) > self.max_edge:
+                image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+            if self.grayscale is True or (self.grayscale == "auto" and self._colourless(image, ImageStat)):
+                image = image.convert("L")
+            buffer = io.BytesIO()
+            if self.format in ("jpeg", "webp"):
+                image.save(buffer, format=self.format.upper(), quality=self.quality, optimize=True)
+            else:
+                image.save(buffer, format="PNG", optimize=True)
+            return buffer.getvalue()
+
+    @staticmethod
+    def _colourless(image, image_stat) -> bool:
+        saturation = image.resize((64, 64)).convert("HSV").split()[1]
+        return image_stat.Stat(saturation).mean[0] < GRAYSCALE_SATURATION
+
+    def load_or_render(self, image_path: str, digest: str) -> bytes:
+        """Precomputed variant from disk when present, else rendered and stored."""
+        path = self.variant_path(digest)
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        data = self.render(image_path)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return data
+
+
+def encode_file(image_path: str) -> str:
+    with open(image_path, 'rb') as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+def configure_image_cache(max_bytes: Optional[int] = None) -> None:
+    """Size the shared payload cache (image_cache_mb in config.yaml); drops cached payloads."""
+    global _cache
+    with _registry_lock:
+        _cache = EncodedImageCache(max_bytes or DEFAULT_MAX_BYTES)
+
+
+def configure_image_profiles(profiles: Optional[Dict[str, Dict[str, Any]]], variant_dir: Optional[str] = None) -> None:
+    """
+    Set per-model image profiles, usually the image_profiles section of config.yaml:
+        {model_name: {"format": ..., "max_edge": ..., "quality": ..., "grayscale": ...}}
+    The "default" entry applies to models that are not listed. Re-encoded variants are
+    stored under variant_dir.
+    """
+    global _variant_dir
+    with _registry_lock:
+        _profiles.clear()
+        for model_name, profile in (profiles or {}).items():
+            _profiles[model_name] = profile or {}
+        _variant_dir = variant_dir
+
+
+def get_image_profile(model_name: str) -> ImageProfile:
+    with _registry_lock:
+        settings = {**_profiles.get("default", {}), **_profiles.get(model_name, {})}
+        variant_dir = _variant_dir
+    return ImageProfile(settings, variant_dir)
+
+
+def get_image_cache() -> EncodedImageCache:
+    global _cache
+    with _registry_lock:
+        if _cache is None:
+            _cache = EncodedImageCache()
+        return _cache
+
+
+def get_image_index(image_root_path: str) -> ImageIndex:
+    """Index of an image root, scanned on first use and shared by every adapter."""
+    key = os.path.abspath(image_root_path)
+    with _registry_lock:
+        index = _indexes.get(key)
+    if index is None:
+        index = ImageIndex(image_root_path)
+        with _registry_lock:
+            index = _indexes.setdefault(key, index)
+    return index
+
+
+def encoded_image(image_path: str, profile: Optional[ImageProfile] = None) -> str:
+    """Base64 of an image under profile (default: the file as is), served from the shared cache."""
+    if profile is None or profile.is_original:
+        return get_image_cache().get_or_encode(image_path)
+    return get_image_cache().get_or_encode(
+        image_path, profile.variant,
+        encode=lambda path: base64.b64encode(profile.load_or_render(path, file_digest(path))).decode("utf-8"),
+    )
+
+
+def _precompute_worker(image_path: str, settings: Dict[str, Any], variant_dir: str) -> int:
+    profile = ImageProfile(settings, variant_dir)
+    return len(profile.load_or_render(image_path, file_digest(image_path)))
+
+
+def precompute_image_variants(image_root_path: str, profiles: Iterable[ImageProfile],
+                              max_workers: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Render every image under image_root_path for each re-encoding profile ahead of a run,
+    in a process pool. Variants already on disk are kept.
+
+    Returns:
+        {variant: {"images": n, "original_bytes": ..., "bytes": ...}}
+    """
+    image_paths = get_image_index(image_root_path).paths()
+    original_bytes = sum(os.path.getsize(path) for path in image_paths)
+    distinct = {}
+    for profile in profiles:
+        if not profile.is_original and profile.variant_dir:
+            distinct.setdefault(profile.variant, profile)
+
+    summary = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for variant, profile in distinct.items():
+            futures = [executor.submit(_precompute_worker, path, profile.settings(), profile.variant_dir)
+                       for path in image_paths]
+            total = 0
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f"🖼️ Encoding {variant}"):
+                try:
+                    total += future.result()
+                except Exception as e:
+                    print(f"❌ Image encoding failed for {variant}: {e}")
+            summary[variant] = {"images": len(image_paths), "original_bytes": original_bytes, "bytes": total}
+            ratio = total / original_bytes if original_bytes else 0.0
+            print(f"🖼️ {variant}: {len(image_paths)} images, {total / 1e6:.1f} MB ({ratio:.1%} of the originals)")
+    return summary
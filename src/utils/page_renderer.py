@@ -0,0 +1,134 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Set, Tuple
+
+import fitz  # PyMuPDF
+from tqdm import tqdm
+
+from src.models.ocr.OcrCache import file_digest
+
+MANIFEST_NAME = ".render_manifest.json"  # image file name -> source PDF hash, page and dpi
+_PAGE_ID = re.compile(r"(?:^|_)I(\d+)$")
+
+
+def collect_image_requests(benchmark_folder: str = "benchmarks") -> Dict[str, Set[int]]:
+    """
+    Pages referenced by image_index in every benchmarks/*.json file.
+
+    Ids name their paper ("S038_I002"); bare ids ("I001") belong to the case's pdf_index.
+
+    Returns:
+        {pdf_index: {page_number, ...}} with 1-based page numbers.
+    """
+    requests = {}
+    for file_name in sorted(os.listdir(benchmark_folder)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(benchmark_folder, file_name), "r", encoding="utf-8") as f:
+            test_cases = json.load(f)
+
+        for case in test_cases:
+            case_input = case["test_case"]["input"]
+            pdf_indices = [p.strip() for p in case_input["pdf_index"].split(",")]
+            image_index = case_input.get("image_index", [])
+            if isinstance(image_index, str):
+                image_index = [image_index] if image_index else []
+            for image_id in image_index:
+                match = _PAGE_ID.search(image_id)
+                if not match:
+                    continue
+                prefix = image_id[:match.start()]
+                for pdf_index in ([prefix] if prefix else pdf_indices):
+                    requests.setdefault(pdf_index, set()).add(int(match.group(1)))
+    return requests
+
+
+def _image_name(pdf_index: str, page_number: int) -> str:
+    return f"{pdf_index}_I{page_number:03d}.png"  # same names as convert_pdf_to_images
+
+
+def _render_worker(pdf_path: str, pdf_index: str, page_numbers: List[int], output_dir: str, dpi: int,
+                   manifest: Dict[str, Dict]) -> Tuple[Dict[str, Dict], int]:
+    # Runs in a worker process: pages are rendered and written one at a time
+    digest = file_digest(pdf_path)
+    rendered, skipped = {}, 0
+    with fitz.open(pdf_path) as doc:
+        for page_number in sorted(page_numbers):
+            name = _image_name(pdf_index, page_number)
+            image_path = os.path.join(output_dir, name)
+            entry = manifest.get(name) or {}
+            if os.path.exists(image_path) and entry.get("source") == digest and entry.get("dpi") == dpi:
+                skipped += 1
+                continue
+            if not 1 <= page_number <= doc.page_count:
+                print(f"⚠️ {pdf_index} has {doc.page_count} pages, cannot render page {page_number}")
+                continue
+            pixmap = doc.load_page(page_number - 1).get_pixmap(dpi=dpi)
+            tmp_path = f"{image_path}.{os.getpid()}.tmp"
+            pixmap.save(tmp_path, output="png")
+            os.replace(tmp_path, image_path)
+            rendered[name] = {"source": digest, "page": page_number, "dpi": dpi}
+    return rendered, skipped
+
+
+def _load_manifest(output_dir: str) -> Dict[str, Dict]:
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(output_dir: str, manifest: Dict[str, Dict]) -> None:
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def render_referenced_pages(benchmark_folder: str = "benchmarks", pdf_root_path: str = "src/data/raw_pdfs",
+                            output_dir: str = "src/data/images", dpi: int = 200,
+                            max_workers: int = None) -> Dict[str, int]:
+    """
+    Render only the pages the benchmark references to PNG with PyMuPDF pixmaps, one task
+    per PDF across a process pool. A page is skipped when its image exists and the manifest records the
+    same source PDF hash and dpi, so re-runs only touch new or changed papers.
+
+    Returns:
+        {"rendered": n, "skipped": n, "failed": n} page counts (failed counts PDFs).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+    jobs = []
+    for pdf_index, page_numbers in sorted(collect_image_requests(benchmark_folder).items()):
+        pdf_path = os.path.join(pdf_root_path, f"{pdf_index}.pdf")
+        if os.path.exists(pdf_path):
+            jobs.append((pdf_path, pdf_index, sorted(page_numbers)))
+        else:
+            print(f"⚠️ PDF file does not exist, skipping render: {pdf_path}")
+
+    counts = {"rendered": 0, "skipped": 0, "failed": 0}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for pdf_path, pdf_index, page_numbers in jobs:
+                names = [_image_name(pdf_index, n) for n in page_numbers]
+                entries = {name: manifest[name] for name in names if name in manifest}
+                futures[executor.submit(_render_worker, pdf_path, pdf_index, page_numbers, output_dir, dpi,
+                                        entries)] = pdf_path
+            for future in tqdm(as_completed(futures), total=len(futures), desc="🖼️ Rendering referenced pages"):
+                try:
+                    rendered, skipped = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to render {futures[future]}: {e}")
+                    counts["failed"] += 1
+                    continue
+                manifest.update(rendered)
+                counts["rendered"] += len(rendered)
+                counts["skipped"] += skipped
+    finally:
+        _save_manifest(output_dir, manifest)
+    print(f"🖼️ Rendered {counts['rendered']} pages, {counts['skipped']} unchanged, {counts['failed']} PDFs failed")
+    return counts
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Set
+
+from tqdm import tqdm
+
+from src.models.ocr.OcrCache import OcrCache
+from src.models.ocr.pyMuPDF import ExtractTextByPyMuPDF
+from src.models.ocr.Mistral import ExtractTextByMistral
+
+
+def collect_ocr_requests(benchmark_folder: str = "benchmarks") -> Dict[str, Set[str]]:
+    """
+    Scan every benchmarks/*.json file and collect the distinct pdf_index values together
+    with the image_index pages referenced for them.
+
+    Returns:
+        {pdf_index: {image_index, ...}}; an empty set means only full-PDF cases use the paper.
+    """
+    requests = {}
+    for file_name in sorted(os.listdir(benchmark_folder)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(benchmark_folder, file_name), "r", encoding="utf-8") as f:
+            test_cases = json.load(f)
+
+        for case in test_cases:
+            case_input = case["test_case"]["input"]
+            image_index = case_input.get("image_index", [])
+            if isinstance(image_index, str):
+                image_index = [image_index] if image_index else []
+            for pdf_index in case_input["pdf_index"].split(","):
+                requests.setdefault(pdf_index.strip(), set()).update(image_index)
+    return requests
+
+
+def _pymupdf_worker(pdf_path: str, cache_dir: str, layout: str = "text") -> int:
+    # Runs in a worker process: each process opens the shared on-disk cache itself
+    ocr_model = ExtractTextByPyMuPDF(cache=OcrCache(cache_dir), layout=layout)
+    return len(ocr_model.extract_text(pdf_path, page_numbers=None))
+
+
+def prewarm_pymupdf(pdf_paths: Iterable[str], cache_dir: str, max_workers: int = None,
+                    layout: str = "text") -> Dict[str, int]:
+    """
+    Extract every PDF with PyMuPDF across a process pool, in the layout the pipelines read.
+    Returns {pdf_path: pages cached}.
+    """
+    pdf_paths = list(pdf_paths)
+    done = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_pymupdf_worker, path, cache_dir, layout): path for path in pdf_paths}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="🔥 Prewarming PyMuPDF OCR"):
+            path = futures[future]
+            try:
+                done[path] = future.result()
+            except Exception as e:
+                print(f"[❌ ERROR] PyMuPDF prewarm failed for {path}: {e}")
+    return done
+
+
+async def prewarm_mistral(pdf_paths: Iterable[str], ocr_model: ExtractTextByMistral,
+                          max_concurrency: int = 8) -> Dict[str, int]:
+    """Run Mistral OCR for every PDF with at most max_concurrency documents in flight."""
+    pdf_paths = list(pdf_paths)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    progress_bar = tqdm(total=len(pdf_paths), desc="🔥 Prewarming Mistral OCR")
+    done = {}
+
+    async def run_pdf(path):
+        async with semaphore:
+            try:
+                pages = await asyncio.to_thread(ocr_model.extract_text, path, None)
+                done[path] = len(pages)
+            except Exception as e:
+                print(f"[❌ ERROR] Mistral prewarm failed for {path}: {e}")
+        progress_bar.update(1)
+
+    await asyncio.gather(*(run_pdf(path) for path in pdf_paths))
+    return done
+
+
+def prewarm(benchmark_folder: str, pdf_root_path: str, cache: OcrCache, mistral_api_key: str = None,
+            engines: Iterable[str] = ("pymupdf", "mistral"), max_workers: int = None,
+            max_concurrency: int = 8, pymupdf_layout: str = "text") -> Dict[str, Dict[str, int]]:
+    """
+    Fill the OCR cache for every PDF referenced by the benchmark before any LLM call starts,
+    so model workers only read cached text.
+    """
+    pdf_paths = []
+    for pdf_index in sorted(collect_ocr_requests(benchmark_folder)):
+        pdf_path = os.path.join(pdf_root_path, f"{pdf_index}.pdf")
+        if os.path.exists(pdf_path):
+            pdf_paths.append(pdf_path)
+        else:
+            print(f"⚠️ PDF file does not exist, skipping prewarm: {pdf_path}")
+
+    results = {}
+    if "pymupdf" in engines:
+        results["pymupdf"] = prewarm_pymupdf(pdf_paths, cache.cache_dir, max_workers=max_workers,
+                                             layout=pymupdf_layout)
+    if "mistral" in engines and mistral_api_key:
+        ocr_model = ExtractTextByMistral(mistral_api_key, cache=cache)
+        results["mistral"] = asyncio.run(prewarm_mistral(pdf_paths, ocr_model, max_concurrency))
+    return results
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"  # what OpenAI() uses when no base_url is given
+IMAGE_TOKENS = 1000  # flat estimate per image_url part, about one high-detail page image
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one minute of budget.
+
+    Callers reserve capacity up front and get back how long they must wait; the bucket may go
+    into debt, so waiting never happens while the lock is held and the same bucket serves
+    threads and event loops alike.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return the seconds to wait before using it."""
+        amount = min(amount, self.capacity)  # a single oversized request must still be able to pass
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.rate_per_second
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, with a negative amount, charge) budget after the real cost is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+
+class ProviderRateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets of one provider endpoint."""
+
+    def __init__(self, base_url: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.base_url = base_url
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waited_seconds = 0.0
+
+    @staticmethod
+    def estimate_tokens(messages: List[Dict]) -> int:
+        """
+        Rough prompt size used until usage comes back: about four characters per token of
+        text, IMAGE_TOKENS per image part (its base64 payload is not text).
+        """
+        chars, images = 0, 0
+        for message in messages:
+            content = message.get("content", "")
+            if not isinstance(content, list):
+                chars += len(str(content))
+                continue
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    images += 1
+                elif isinstance(part, dict):
+                    chars += len(str(part.get("text", "")))
+                else:
+                    chars += len(str(part))
+        return chars // 4 + 1 + images * IMAGE_TOKENS
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        self.waited_seconds += wait
+        return wait
+
+    def acquire(self, estimated_tokens: int = 0) -> None:
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, estimated_tokens: int = 0) -> None:
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token budget once the provider reported the real usage."""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+
+_limiters = {}
+_limits_config = {}
+_registry_lock = threading.Lock()
+
+
+def _normalize(base_url: str) -> str:
+    return (base_url or DEFAULT_BASE_URL).rstrip("/").lower()
+
+
+def configure_rate_limits(limits: Optional[Dict[str, Dict[str, float]]]) -> None:
+    """
+    Set the per-provider budgets, usually the rate_limits section of config.yaml:
+        {base_url: {"rpm": requests per minute, "tpm": tokens per minute}}
+    Limiters handed out before this call keep their old budgets.
+    """
+    with _registry_lock:
+        _limits_config.clear()
+        for base_url, budget in (limits or {}).items():
+            _limits_config[_normalize(base_url)] = budget or {}
+
+
+def get_rate_limiter(base_url: str) -> ProviderRateLimiter:
+    """The limiter shared by every adapter and pipeline that talks to base_url."""
+    key = _normalize(base_url)
+    with _registry_lock:
+        if key not in _limiters:
+            budget = _limits_config.get(key, {})
+            _limiters[key] = ProviderRateLimiter(key, rpm=budget.get("rpm"), tpm=budget.get("tpm"))
+        return _limiters[key]
@@ -0,0 +1,376 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.utils.rate_limiter import ProviderRateLimiter, TokenBucket
+from src.utils.response_cache import ResponseCache
+
+CHAT_COMPLETIONS_PATH = "/chat/completions"
+
+
+def request_key(body: Dict[str, Any]) -> str:
+    """Replay key of a chat-completions request body: model, messages and every other field."""
+    params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+    return ResponseCache.key(body.get("model", ""), body.get("messages", []), params)
+
+
+# --------------------------------------------------------------------------- record
+
+class Recorder:
+    """Appends real chat-completions request/response pairs to a JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+
+    def record(self, request: httpx.Request, status_code: int, headers: httpx.Headers,
+               raw_body: bytes, latency: float) -> None:
+        if request.method != "POST" or not request.url.path.endswith(CHAT_COMPLETIONS_PATH):
+            return
+        try:
+            request_body = json.loads(request.content)
+            # Decode with the original headers so gzip/br bodies come out as JSON
+            response_body = httpx.Response(status_code, headers=headers, content=raw_body).json()
+        except (ValueError, httpx.DecodingError):
+            return
+        line = json.dumps({
+            "key": request_key(request_body),
+            "url": str(request.url),
+            "request": request_body,
+            "status_code": status_code,
+            "retry_after": headers.get("retry-after"),
+            "response": response_body,
+            "latency_ms": round(latency * 1000, 2),
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def _redirect(request: httpx.Request, redirect_url: Optional[str]) -> None:
+    """Send the request to redirect_url (scheme, host, port) keeping its path and query."""
+    if not redirect_url:
+        return
+    target = httpx.URL(redirect_url)
+    request.url = request.url.copy_with(scheme=target.scheme, host=target.host, port=target.port)
+    request.headers["Host"] = target.netloc.decode("ascii")
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Wraps a pooled transport to record chat completions and/or redirect them to a mock server."""
+
+    def __init__(self, transport: httpx.BaseTransport, recorder: Optional[Recorder] = None,
+                 redirect_url: Optional[str] = None):
+        self._transport = transport
+        self._recorder = recorder
+        self._redirect_url = redirect_url
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _redirect(request, self._redirect_url)
+        start = time.time()
+        response = self._transport.handle_request(request)
+        if self._recorder is None:
+            return response
+        try:
+            raw_body = b"".join(response.stream)
+        finally:
+            response.close()
+        self._recorder.record(request, response.status_code, response.headers, raw_body, time.time() - start)
+        return httpx.Response(response.status_code, headers=response.headers, stream=httpx.ByteStream(raw_body),
+                              extensions=response.extensions)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, recorder: Optional[Recorder] = None,
+                 redirect_url: Optional[str] = None):
+        self._transport = transport
+        self._recorder = recorder
+        self._redirect_url = redirect_url
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _redirect(request, self._redirect_url)
+        start = time.time()
+        response = await self._transport.handle_async_request(request)
+        if self._recorder is None:
+            return response
+        try:
+            raw_body = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        self._recorder.record(request, response.status_code, response.headers, raw_body, time.time() - start)
+        return httpx.Response(response.status_code, headers=response.headers, stream=httpx.ByteStream(raw_body),
+                              extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# --------------------------------------------------------------------------- replay
+
+class LatencyModel:
+    """
+    Response latency of the mock server, in seconds.
+        fixed:     {"distribution": "fixed", "ms": 500}
+        uniform:   {"distribution": "uniform", "low_ms": 200, "high_ms": 2000}
+        lognormal: {"distribution": "lognormal", "median_ms": 800, "sigma": 0.6}  (long tail, like real APIs)
+        recorded:  {"distribution": "recorded", "scale": 1.0}  (the latency seen when recording)
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, seed: Optional[int] = None):
+        self.settings = settings or {"distribution": "fixed", "ms": 0}
+        self.distribution = self.settings.get("distribution", "fixed")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: Optional[int] = None) -> "LatencyModel":
+        """Command-line form: fixed:500, uniform:200:2000, lognormal:800:0.6, recorded[:scale]."""
+        name, *values = spec.split(":")
+        values = [float(v) for v in values]
+        if name == "fixed":
+            settings = {"ms": values[0] if values else 0}
+        elif name == "uniform":
+            settings = {"low_ms": values[0], "high_ms": values[1]}
+        elif name == "lognormal":
+            settings = {"median_ms": values[0], "sigma": values[1] if len(values) > 1 else 0.5}
+        elif name == "recorded":
+            settings = {"scale": values[0] if values else 1.0}
+        else:
+            raise ValueError(f"Unknown latency distribution: {name}")
+        return cls({"distribution": name, **settings}, seed=seed)
+
+    def sample(self, recorded_ms: Optional[float] = None) -> float:
+        s = self.settings
+        with self._lock:
+            if self.distribution == "uniform":
+                ms = self._rng.uniform(s["low_ms"], s["high_ms"])
+            elif self.distribution == "lognormal":
+                ms = self._rng.lognormvariate(math.log(s["median_ms"]), s.get("sigma", 0.5))
+            elif self.distribution == "recorded" and recorded_ms is not None:
+                ms = recorded_ms * s.get("scale", 1.0)
+            else:
+                ms = s.get("ms", 0)
+        return ms / 1000.0
+
+
+class MockChatServer:
+    """
+    Local OpenAI-compatible chat-completions server for load testing the harness offline.
+
+    Requests are answered from recordings (matched by request_key), or with a synthetic
+    "<Answer> ... </Answer>" reply when no recording matches. Latency follows a
+    LatencyModel; error_rate injects 500s, rate_limit_rate injects 429s with Retry-After,
+    and rpm enforces a real requests-per-minute budget that answers 429 when exceeded.
+    Any path ending in /chat/completions is served, so every adapter's base_url works;
+    GET /stats returns the counters.
+    """
+
+    def __init__(self, recordings_path: Optional[str] = None, host: str = "127.0.0.1", port: int = 8089,
+                 latency: Optional[LatencyModel] = None, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, rpm: Optional[float] = None, fallback_answer: str = "<Answer> A </Answer>",
+                 seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.requests_bucket = TokenBucket(rpm) if rpm else None
+        self.fallback_answer = fallback_answer
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "replayed": 0, "synthetic": 0, "rate_limited": 0, "server_errors": 0}
+
+        self.recordings = {}
+        if recordings_path and os.path.exists(recordings_path):
+            with open(recordings_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line of an interrupted recording
+                    if record.get("status_code") == 200:
+                        self.recordings[record["key"]] = record
+        self._server = None
+
+    @classmethod
+    def from_config(cls, settings: Dict[str, Any], recordings_path: Optional[str] = None) -> "MockChatServer":
+        """Build the server from the replay.server section of config.yaml."""
+        address = urlsplit(settings.get("url", "http://127.0.0.1:8089"))
+        return cls(
+            recordings_path=recordings_path,
+            host=address.hostname,
+            port=address.port,
+            latency=LatencyModel(settings.get("latency"), seed=settings.get("seed")),
+            error_rate=settings.get("error_rate", 0.0),
+            rate_limit_rate=settings.get("rate_limit_rate", 0.0),
+            retry_after=settings.get("retry_after", 1.0),
+            rpm=settings.get("rpm"),
+            seed=settings.get("seed"),
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _synthetic_response(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_tokens = ProviderRateLimiter.estimate_tokens(body.get("messages", []))
+        completion_tokens = len(self.fallback_answer) // 4 + 1
+        return {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.fallback_answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def handle(self, body: Dict[str, Any]):
+        """(status, headers, payload, delay seconds) for one chat-completions request."""
+        self._count("requests")
+
+        if self.requests_bucket is not None:
+            wait = self.requests_bucket.reserve(1)
+            if wait > 0:
+                self.requests_bucket.refund(1)  # rejected requests do not use budget
+                self._count("rate_limited")
+                return 429, {"Retry-After": f"{wait:.3f}"}, _error_body("Rate limit reached", "rate_limit_exceeded"), 0.0
+
+        draw = self._draw()
+        if draw < self.rate_limit_rate:
+            self._count("rate_limited")
+            return 429, {"Retry-After": f"{self.retry_after:g}"}, _error_body("Injected rate limit", "rate_limit_exceeded"), 0.0
+        if draw < self.rate_limit_rate + self.error_rate:
+            self._count("server_errors")
+            return 500, {}, _error_body("Injected server error", "server_error"), self.latency.sample()
+
+        record = self.recordings.get(request_key(body))
+        if record is not None:
+            self._count("replayed")
+            return 200, {}, record["response"], self.latency.sample(record.get("latency_ms"))
+        self._count("synthetic")
+        return 200, {}, self._synthetic_response(body), self.latency.sample()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so the client pools behave as against a provider
+
+            def _send(self, status, headers, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    self._send(200, {}, dict(server.stats, recordings=len(server.recordings)))
+                else:
+                    self._send(404, {}, _error_body("Not found", "not_found"))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                if not self.path.split("?")[0].endswith(CHAT_COMPLETIONS_PATH):
+                    self._send(404, {}, _error_body(f"Mock server only serves {CHAT_COMPLETIONS_PATH}", "not_found"))
+                    return
+                try:
+                    body = json.loads(raw)
+                except json.JSONDecodeError:
+                    self._send(400, {}, _error_body("Request body is not JSON", "invalid_request_error"))
+                    return
+                status, headers, payload, delay = server.handle(body)
+                if delay > 0:
+                    time.sleep(delay)
+                self._send(status, headers, payload)
+
+            def log_message(self, format, *args):
+                pass  # one line per request would drown the benchmark output
+
+        return Handler
+
+    def start(self) -> "MockChatServer":
+        """Serve in a daemon thread of this process."""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-chat-server", daemon=True).start()
+        print(f"🧪 Mock chat server on http://{self.host}:{self.port} ({len(self.recordings)} recordings)")
+        return self
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _error_body(message: str, code: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": code, "code": code}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server for offline load tests")
+    parser.add_argument("--recordings", default="src/data/recordings.jsonl", help="JSONL written in record mode")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="lognormal:800:0.5",
+                        help="fixed:MS | uniform:LOW:HIGH | lognormal:MEDIAN:SIGMA | recorded[:SCALE]")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of injected 429s")
+    parser.add_argument("--rpm", type=float, default=None, help="requests per minute before real 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    MockChatServer(
+        recordings_path=args.recordings,
+        host=args.host,
+        port=args.port,
+        latency=LatencyModel.parse(args.latency, seed=args.seed),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        rpm=args.rpm,
+        seed=args.seed,
+    ).serve_forever()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Opt-in cache of model answers keyed by a canonical hash of the request: model name,
+    the fully rendered messages, the digests of attached images and the sampling
+    parameters. A rerun with unchanged prompts, OCR text and model is answered from
+    here and not billed again.
+
+    Entries live in one SQLite file (WAL mode, safe to share between the model threads
+    of one run) and are evicted by age (ttl_seconds) and by count (max_entries, least
+    recently used first).
+    """
+
+    SCHEMA_VERSION = 1  # part of every key, bump to invalidate all entries
+    EVICT_EVERY = 100  # stores between two eviction passes
+
+    def __init__(self, path: str = "src/data/response_cache.sqlite", ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stores = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " token_count TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.evict()
+
+    @classmethod
+    def from_config(cls, settings: Optional[Dict[str, Any]]) -> Optional["ResponseCache"]:
+        """Build the cache from the response_cache section of config.yaml, None when disabled."""
+        if not settings or not settings.get("enabled"):
+            return None
+        ttl_days = settings.get("ttl_days")
+        return cls(
+            path=settings.get("path", "src/data/response_cache.sqlite"),
+            ttl_seconds=ttl_days * 86400 if ttl_days else None,
+            max_entries=settings.get("max_entries"),
+        )
+
+    @classmethod
+    def key(cls, model: str, messages: Any, params: Optional[Dict[str, Any]] = None,
+            image_digests: Iterable[str] = ()) -> str:
+        """
+        Canonical request hash. Dict keys are sorted and separators fixed, so two renders of
+        the same prompt always hash alike; images embedded in the messages are covered by
+        the messages themselves, image_digests covers images sent by reference.
+        """
+        payload = json.dumps({
+            "schema": cls.SCHEMA_VERSION,
+            "model": model,
+            "messages": messages,
+            "params": params or {},
+            "images": sorted(image_digests),
+        }, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        """(answer, token_count) of a live entry, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, token_count, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[2] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, model: str, answer: str, token_count: Dict[str, int]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, answer, token_count, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, answer, json.dumps(token_count), now, now),
+            )
+            self._stores += 1
+            evict = self._stores % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used ones beyond max_entries."""
+        removed = 0
+        with self._lock:
+            if self.ttl_seconds:
+                cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?",
+                                            (time.time() - self.ttl_seconds,))
+                removed += cursor.rowcount
+            if self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                removed += cursor.rowcount
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
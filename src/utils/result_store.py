@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Set
+
+
+class ResultStore:
+    """
+    Append-only JSONL store for the predictions of one model on one task.
+
+    Layout: eval_sets/<model>/<task>.jsonl, one prediction per line. Appends never
+    rewrite earlier records, so a crash can at most leave a partial last line,
+    which the readers skip. Records from a legacy eval_sets/<model>/<task>.json
+    array are still read (before the JSONL records) until compact() folds them in.
+    """
+
+    SUFFIX = ".jsonl"
+    LEGACY_SUFFIX = ".json"
+
+    def __init__(self, model_dir: str, data_name: str, fsync_every: int = 20):
+        """
+        Args:
+            model_dir: eval_sets/<model> directory.
+            data_name: Task name, i.e. the benchmark file name without ".json".
+            fsync_every: Number of appends between two fsync calls.
+        """
+        self.model_dir = model_dir
+        self.data_name = data_name
+        self.path = os.path.join(model_dir, f"{data_name}{self.SUFFIX}")
+        self.legacy_path = os.path.join(model_dir, f"{data_name}{self.LEGACY_SUFFIX}")
+        self.fsync_every = max(1, fsync_every)
+
+        self._file = None
+        self._pending_sync = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def list_tasks(cls, model_dir: str) -> List[str]:
+        """Task names that have results in model_dir (JSONL or legacy JSON)."""
+        names = set()
+        for filename in os.listdir(model_dir):
+            if filename.endswith(cls.SUFFIX):
+                names.add(filename[:-len(cls.SUFFIX)])
+            elif filename.endswith(cls.LEGACY_SUFFIX) and not filename.endswith(("_summary.json", "_error.json")):
+                names.add(filename[:-len(cls.LEGACY_SUFFIX)])
+        return sorted(names)
+
+    def append(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.model_dir, exist_ok=True)
+                needs_newline = self._ends_with_partial_line()
+                self._file = open(self.path, "a", encoding="utf-8")
+                if needs_newline:
+                    # Terminate a torn last line so the next record starts cleanly
+                    self._file.write("\n")
+            self._file.write(line)
+            self._file.flush()
+            self._pending_sync += 1
+            if self._pending_sync >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._pending_sync = 0
+
+    def _ends_with_partial_line(self) -> bool:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._file is not None and self._pending_sync:
+                os.fsync(self._file.fileno())
+                self._pending_sync = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                if self._pending_sync:
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._pending_sync = 0
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.iter_records()
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Stream every stored record, legacy JSON array first, then the JSONL log."""
+        if os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            if isinstance(legacy, list):
+                yield from legacy
+
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write from an interrupted run, the case will simply be redone
+                        continue
+
+    def case_ids(self) -> Set[str]:
+        return {record.get("case_id") for record in self.iter_records()}
+
+    def compact(self) -> int:
+        """
+        Rewrite the store as a single deduplicated JSONL file (last record per case_id wins)
+        and drop the legacy JSON array. The new file is written next to the old one and
+        swapped in with os.replace, so an interrupted compaction loses nothing.
+
+        Returns:
+            Number of records kept.
+        """
+        self.close()
+        latest = {}
+        for record in self.iter_records():
+            latest[record.get("case_id")] = record
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in latest.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        if os.path.exists(self.legacy_path):
+            os.remove(self.legacy_path)
+        return len(latest)
+
+
+def iter_result_records(result_path: str) -> Iterator[Dict]:
+    """Stream records from a result file given either as <task>.jsonl or legacy <task>.json."""
+    model_dir, filename = os.path.split(result_path)
+    data_name = os.path.splitext(filename)[0]
+    yield from ResultStore(model_dir, data_name).iter_records()
+
+
+def compact_eval_sets(eval_sets_dir: str = "eval_sets") -> Dict[str, int]:
+    """Compact every result store under eval_sets_dir. Returns {"<model>/<task>": records}."""
+    kept = {}
+    for model_name in os.listdir(eval_sets_dir):
+        model_dir = os.path.join(eval_sets_dir, model_name)
+        if not os.path.isdir(model_dir):
+            continue
+        for data_name in ResultStore.list_tasks(model_dir):
+            kept[f"{model_name}/{data_name}"] = ResultStore(model_dir, data_name).compact()
+    return kept
+
+
+
+def merge_shard_segments(shard_root: str = "eval_shards", eval_sets_dir: str = "eval_sets") -> Dict[str, int]:
+    """
+    Merge the per-node segments shard_root/<i>-of-<N>/<model>/<task>.jsonl into
+    eval_sets/<model>/<task>.jsonl, skipping cases already present, then compact the
+    merged stores. The result has the same layout as a single-node run.
+
+    Returns:
+        {"<model>/<task>": records in the merged store}
+    """
+    if not os.path.isdir(shard_root):
+        print(f"⚠️ No shard segments under {shard_root}, nothing to merge")
+        return {}
+    merged = set()
+    for shard_name in sorted(os.listdir(shard_root)):
+        shard_dir = os.path.join(shard_root, shard_name)
+        if not os.path.isdir(shard_dir):
+            continue
+        for model_name in sorted(os.listdir(shard_dir)):
+            model_dir = os.path.join(shard_dir, model_name)
+            if not os.path.isdir(model_dir):
+                continue
+            for data_name in ResultStore.list_tasks(model_dir):
+                target = ResultStore(os.path.join(eval_sets_dir, model_name), data_name)
+                present = target.case_ids()
+                for record in ResultStore(model_dir, data_name).iter_records():
+                    if record.get("case_id") not in present:
+                        target.append(record)
+                        present.add(record.get("case_id"))
+                target.close()
+                merged.add((model_name, data_name))
+
+    return {
+        f"{model_name}/{data_name}": ResultStore(os.path.join(eval_sets_dir, model_name), data_name).compact()
+        for model_name, data_name in sorted(merged)
+    }
@@ -0,0 +1,124 @@
+import email.utils
+import random
+import time
+from enum import Enum
+from typing import Any, Dict, Optional
+
+
+class ErrorKind(str, Enum):
+    RATE_LIMIT = "rate_limit"      # 429, provider asks us to slow down
+    TIMEOUT = "timeout"            # request or read timeout
+    CONNECTION = "connection"      # DNS, TLS, reset connections
+    SERVER = "server"              # 5xx, provider side failure
+    BAD_REQUEST = "bad_request"    # 400/404/413/422, retrying sends the same broken request
+    AUTH = "auth"                  # 401/403, retrying cannot help
+    UNKNOWN = "unknown"            # anything else, including adapters that only report "error"
+
+
+RETRYABLE = {ErrorKind.RATE_LIMIT, ErrorKind.TIMEOUT, ErrorKind.CONNECTION, ErrorKind.SERVER, ErrorKind.UNKNOWN}
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        try:
+            # HTTP-date form
+            return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def classify_error(exc: BaseException) -> ErrorKind:
+    """Map an exception from the OpenAI / Mistral / httpx clients to an ErrorKind."""
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+
+    if status_code is not None:
+        if status_code == 429:
+            return ErrorKind.RATE_LIMIT
+        if status_code in (401, 403):
+            return ErrorKind.AUTH
+        if status_code in (408, 504):
+            return ErrorKind.TIMEOUT
+        if status_code >= 500:
+            return ErrorKind.SERVER
+        if 400 <= status_code < 500:
+            return ErrorKind.BAD_REQUEST
+
+    name = type(exc).__name__.lower()
+    if "ratelimit" in name:
+        return ErrorKind.RATE_LIMIT
+    if "timeout" in name or isinstance(exc, TimeoutError):
+        return ErrorKind.TIMEOUT
+    if "connection" in name or isinstance(exc, ConnectionError):
+        return ErrorKind.CONNECTION
+    return ErrorKind.UNKNOWN
+
+
+def describe_error(exc: BaseException) -> Dict[str, Any]:
+    """JSON-friendly error record attached to failed predictions (result field "error")."""
+    response = getattr(exc, "response", None)
+    return {
+        "kind": classify_error(exc).value,
+        "status_code": getattr(exc, "status_code", None) or getattr(response, "status_code", None),
+        "retry_after": _parse_retry_after(getattr(response, "headers", None)),
+        "message": str(exc)[:500],
+    }
+
+
+class RetryPolicy:
+    """
+    Per-case retry policy: jittered exponential backoff ("full jitter"), overridden by the
+    provider's Retry-After when it sends one, and no retries for errors that cannot succeed.
+    """
+
+    def __init__(self, max_retries: int = 10, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def max_attempts(self) -> int:
+        return self.max_retries + 1
+
+    @staticmethod
+    def error_of(pred: Optional[Dict[str, Any]], exc: Optional[BaseException] = None) -> Optional[Dict[str, Any]]:
+        """Error record of one attempt, or None when the prediction succeeded."""
+        if exc is not None:
+            return describe_error(exc)
+        # Adapters answer exactly "error" when a call failed; answers that merely mention
+        # the word ("standard error", "error bars") are valid
+        if pred.get("error") or pred.get("predicted_answer") == "error":
+            return pred.get("error") or {"kind": ErrorKind.UNKNOWN.value, "retry_after": None}
+        return None
+
+    def should_retry(self, error: Dict[str, Any], attempt: int) -> bool:
+        """attempt counts from 0 for the first call."""
+        if attempt + 1 >= self.max_attempts:
+            return False
+        try:
+            kind = ErrorKind(error.get("kind"))
+        except ValueError:
+            kind = ErrorKind.UNKNOWN
+        return kind in RETRYABLE
+
+    def delay(self, error: Dict[str, Any], attempt: int) -> float:
+        """Seconds to wait before the next attempt of this case."""
+        retry_after = error.get("retry_after")
+        if retry_after:
+            # Honour the provider, with a little jitter so parked cases do not return in lockstep
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
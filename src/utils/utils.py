@@ -1,15 +1,20 @@
+import asyncio
+import copy
 import json
 import os
-import random
+import threading
 from time import sleep
 import yaml
 from torch import set_float32_matmul_precision
 from tqdm import tqdm
-from src.models.pipeline import Pipeline
+from src.models.pipeline import Pipeline, FanOutPipeline
 
 # ocr
 from src.models.ocr.pyMuPDF import ExtractTextByPyMuPDF
 from src.models.ocr.Mistral import ExtractTextByMistral
+from src.models.ocr.OcrCache import OcrCache
+# retrieval
+from src.models.retrieval.PageRetriever import PageRetriever
 # ir
 from src.models.ir.QWenSeventyTwoModel import QWenModel
 from src.models.ir.LlavaVVicuna import LlavaModel
@@ -29,71 +34,105 @@ from src.models.vlm.QuenMaxModel import QwenMax
 from src.evaluation.export_metric_tables import export_metric_tables
 from src.evaluation.merge_metric_task_files import merge_metric_task_files
 from src.evaluation.cleanup_metrics_and_summaries import delete_unwanted_metric_files, delete_summary_json_files,replace_task_names_in_csv
-from src.evaluation.evaluations import evaluate_results_from_file, summarize_results
-
-
-def append_dict_to_json_file(file_path, new_data, append_mode=True):
-    """Append or overwrite data to a JSON file
-
-    Args:
-    file_path (str): Path to the JSON file
-    new_data (dict or list): Data to append/overwrite
-    append_mode (bool): True for append, False for overwrite
-    """
-    # Make sure the directory exists.
-    directory = os.path.dirname(file_path)
-    if directory:  # Avoid creating the parent directory of the current directory when file_path is the file name
-        os.makedirs(directory, exist_ok=True)
-
-    try:
-        if append_mode:
-            # Append mode: Read the existing content and add it
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                # Verify the data type
-                if not isinstance(data, list):
-                    raise ValueError("JSON content is not a list")
-                # Add new data
-                if isinstance(new_data, dict):
-                    data.append(new_data)
-                elif isinstance(new_data, list) and all(isinstance(item, dict) for item in new_data):
-                    data.extend(new_data)
-                else:
-                    raise TypeError("new_data must be a dictionary or list of dictionaries")
-            except FileNotFoundError:
-                # Create a new list when the file does not exist
-                data = [new_data] if isinstance(new_data, dict) else new_data
-        else:
-            # Overwrite mode: Use new data directly
-            data = [new_data] if isinstance(new_data, dict) else new_data
-
-        # Write to the file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        action = "appended" if append_mode else "overwritten"
-        print(f"Successfully {action} data to {file_path}")
-        return True
-
-    except json.JSONDecodeError:
-        print(f"Error: {file_path} is not a valid JSON file (in append mode)")
-        return False
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return False
+from src.evaluation.evaluations import evaluate_results_from_file, iter_evaluated_results, summarize_results
+from src.evaluation.retrieval_report import retrieval_recall_report
+from src.evaluation.prompt_cache_report import cached_token_report
+from src.utils.result_store import ResultStore, compact_eval_sets, merge_shard_segments
+from src.utils.prewarm import prewarm
+from src.utils.benchmark_index import BenchmarkIndex, parse_shard
+from src.utils.rate_limiter import configure_rate_limits
+from src.utils.context_packer import configure_context_budgets
+from src.utils.http_pool import aclose_http_clients, configure_http_pool, pool_stats
+from src.utils.retry import RetryPolicy
+from src.utils.response_cache import ResponseCache
+from src.utils.replay import MockChatServer
+from src.utils.batch_jobs import BatchJobRunner
+from src.utils.image_cache import (configure_image_cache, configure_image_profiles, get_image_profile,
+                                    precompute_image_variants)
 
 
 class ManageModel:
-    def __init__(self, benchmark_folder="benchmarks"):
+    def __init__(self, benchmark_folder="benchmarks", shard=None):
+        """
+        Args:
+            benchmark_folder: Folder with the <task>.json benchmark files.
+            shard: Optional (i, N); only cases whose case_id hashes to shard i are run and
+                their results go to a per-node segment under shard_path.
+        """
         self.benchmark_folder = benchmark_folder
         self._config=self._load_config()
+        # Provider budgets must be known before any adapter picks up its shared limiter
+        configure_rate_limits(self._config.get("rate_limits"))
+        configure_context_budgets(self._config.get("context_budgets"))
+        configure_image_cache((self._config.get("image_cache_mb") or 0) * 1024 * 1024)
+        configure_image_profiles(self._config.get("image_profiles"),
+                                 self._config.get("image_variant_dir", "src/data/image_variants"))
+        # live | record | replay, see the replay section of config.yaml
+        self.replay = self._config.get("replay") or {}
+        self.mock_server = None
+        configure_http_pool(self._http_pool_settings())
 
         self.save_path = "eval_sets"
+        self.shard = shard
+        self.shard_path = "eval_shards"  # per-node result segments, merged by merge_shards()
+        if self.replay.get("mode") == "replay":
+            # Mock answers must never mark real cases as done or reach the real result files
+            self.save_path = self.replay.get("save_path", "eval_sets_replay")
+            self.shard_path = self.replay.get("shard_path", "eval_shards_replay")
+        self.seed = 0  # case order within a task is shuffled deterministically
+        self.pdf_root_path = r"src\data\raw_pdfs"
         self.all_case_number = 10  # total cases
         self.iter_number = 5  # number of cases per round
         self.rounds_number = 5  # cases calculate the score once
         self.error_number = 10  # allow persistent error count
+        self.retry_policy = RetryPolicy(max_retries=self.error_number)  # backoff per case, honours Retry-After
+        self.use_async = True  # asyncio engine instead of the serial loop
+        self.use_batch = False  # submit all pending cases through the provider batch API (run_benchmark.py --batch)
+        self.batch_path = "batch_jobs"  # request files and job states of batch runs, per model
+        self.batch_poll_interval = 30  # seconds between two batch status checks
+        self.max_concurrency = 32  # in-flight requests per model (asyncio engine)
+        self.questions_per_request = 1  # >1: IR cases on the same pdf, pages and task share one request
+        self.fsync_every = 20  # result appends between two fsync calls
+        self._result_stores = {}
+        self.index_snapshot_path = "src/data/benchmark.mbqc"  # compact corpus snapshot of benchmarks/
+        self._index = None
+        self._index_lock = threading.Lock()
+        # One content-addressed OCR cache shared by every mupdf_* / mis_* pipeline
+        self.ocr_cache = OcrCache(self._config.get("ocr_cache_dir", "src/data/ocr_cache"))
+        # PyMuPDF extraction settings: output layout and processes for long documents
+        self.pymupdf_settings = self._config.get("pymupdf") or {}
+        # Full-PDF cases get only the passages relevant to their question (off unless enabled in config)
+        retrieval = self._config.get("retrieval") or {}
+        self.retriever = PageRetriever(
+            token_budget=retrieval.get("token_budget", 3000),
+            passage_tokens=retrieval.get("passage_tokens", 200),
+            lead_passages=retrieval.get("lead_passages", 1),
+        ) if retrieval.get("enabled") else None
+        # Answers of unchanged requests are replayed instead of re-billed (off unless enabled in config)
+        self.response_cache = ResponseCache.from_config(self._config.get("response_cache"))
+
+    def _pymupdf(self):
+        return ExtractTextByPyMuPDF(
+            cache=self.ocr_cache,
+            layout=self.pymupdf_settings.get("layout", "text"),
+            workers=self.pymupdf_settings.get("workers", 1),
+            parallel_min_pages=self.pymupdf_settings.get("parallel_min_pages", 32),
+        )
+
+    def _http_pool_settings(self):
+        settings = dict(self._config.get("http_pool") or {})
+        mode = self.replay.get("mode", "live")
+        recordings = self.replay.get("recordings", "src/data/recordings.jsonl")
+        server = self.replay.get("server") or {}
+        if mode == "record":
+            settings["record_path"] = recordings
+        elif mode == "replay":
+            # Every pooled client, whatever its base_url, now talks to the mock server;
+            # rate limiters stay keyed by the real endpoints, so they are exercised too
+            settings["redirect_url"] = server.get("url", "http://127.0.0.1:8089")
+            if server.get("autostart", True):
+                self.mock_server = MockChatServer.from_config(server, recordings).start()
+        return settings
 
     @staticmethod
     def _load_config():
@@ -108,12 +147,8 @@ class ManageModel:
             if not os.path.isdir(model_path):
                 continue
 
-            for filename in os.listdir(model_path):
-                if not filename.endswith(".json"):
-                    continue
-
-                result_path = os.path.join(model_path, filename)
-                data_name = filename[:-5]  # Remove the.json suffix
+            for data_name in ResultStore.list_tasks(model_path):
+                result_path = os.path.join(model_path, f"{data_name}{ResultStore.SUFFIX}")
 
                 try:
                     results = evaluate_results_from_file(result_path)
@@ -133,94 +168,527 @@ class ManageModel:
                 # print(f"[✅ Saved] {summary_path}")
 
 
+    def _result_store(self, model_name, data_name):
+        key = (model_name, data_name)
+        if key not in self._result_stores:
+            self._result_stores[key] = ResultStore(os.path.join(self.result_root, model_name), data_name,
+                                                   fsync_every=self.fsync_every)
+        return self._result_stores[key]
+
+    @property
+    def result_root(self):
+        """eval_sets/ for a single-node run, eval_shards/<i>-of-<N>/ for a shard."""
+        if self.shard is None:
+            return self.save_path
+        return os.path.join(self.shard_path, f"{self.shard[0]}-of-{self.shard[1]}")
+
+    def merge_shards(self):
+        """Merge every node's result segment into save_path (same layout as a single-node run)."""
+        return merge_shard_segments(self.shard_path, self.save_path)
+
+    def _close_result_stores(self, model_name):
+        for (store_model, _), store in list(self._result_stores.items()):
+            if store_model == model_name:
+                store.close()
+
+    def _benchmark_index(self):
+        """Parse the benchmark once per process (or read its snapshot) and share it between models."""
+        with self._index_lock:
+            if self._index is None:
+                self._index = BenchmarkIndex.load(self.benchmark_folder, snapshot_path=self.index_snapshot_path)
+            return self._index
+
+    def _start_tracking(self, model_name):
+        index = self._benchmark_index()
+        done_case_ids = set()
+        for data_name in index.tasks:
+            done_case_ids |= self._result_store(model_name, data_name).case_ids()
+            if self.shard is not None:
+                # Cases already merged into eval_sets/ count as done for the shard as well
+                done_case_ids |= ResultStore(os.path.join(self.save_path, model_name), data_name).case_ids()
+        index.start_tracking(model_name, done_case_ids, seed=self.seed, shard=self.shard)
+        return index
+
+    def _pending_cases(self, data_name, model_name):
+        """Pick up to iter_number not-yet-answered cases of one task."""
+        return self._benchmark_index().next_batch(model_name, data_name, self.iter_number)
+
+    def _configure_adapters(self, models):
+        """Hand the run-wide response cache and prompt-caching settings to chat-completions adapters."""
+        prompt_caching = self._config.get("prompt_caching") or {}
+        for model in models:
+            if model is None or not hasattr(model, "response_cache"):
+                continue
+            model.response_cache = self.response_cache
+            # Replayed answers are cached apart from the live ones
+            model.response_cache_namespace = "replay" if self.replay.get("mode") == "replay" else None
+            model.prompt_layout = prompt_caching.get("layout", "question_first")
+            model.cache_control = (prompt_caching.get("cache_control") or {}).get(model.model_name)
+
     def _run(self, pipeline, model_name):
-        all_files = [f for f in os.listdir(self.benchmark_folder) if f.endswith(".json")]
+        self._configure_adapters((pipeline.ir_model, pipeline.vlm_model))
+        if pipeline.retriever is None:
+            pipeline.retriever = self.retriever
+        adapter = pipeline.vlm_model or pipeline.ir_model
+        try:
+            if self.use_batch and getattr(adapter, "supports_batch", False):
+                self._run_batch(pipeline, model_name)
+            elif hasattr(pipeline.vlm_model, "generate_batch"):
+                self._run_local_batch(pipeline, model_name)
+            elif self.use_async:
+                asyncio.run(self._arun(pipeline, model_name))
+            else:
+                self._run_serial(pipeline, model_name)
+        finally:
+            self._close_result_stores(model_name)
+
+    def report_response_cache(self):
+        if self.response_cache is not None:
+            stats = self.response_cache.stats()
+            print(f"🗄️ Response cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} entries")
+
+    def prompt_cache_report(self):
+        """Share of prompt tokens the providers served from their prefix caches, per model and layout."""
+        return cached_token_report(self.save_path)
+
+    def report_http_pools(self):
+        """Print request count, peak concurrency and saturation of every endpoint pool."""
+        for base_url, stats in pool_stats().items():
+            saturation = "⚠️ saturated" if stats["saturated"] else "ok"
+            print(f"🔌 {base_url}: {stats['requests']} requests, peak {stats['peak_in_flight']}"
+                  f"/{stats['max_connections']} in flight, {stats['saturated']} waited for a connection ({saturation})")
+
+    def _render_batch_requests(self, pipeline, cases):
+        """(case_id, create() kwargs) of every case that could be rendered."""
+        adapter = pipeline.vlm_model or pipeline.ir_model
+        requests = []
+        for case in tqdm(cases, desc="🧾 Rendering batch requests"):
+            try:
+                if pipeline.vlm_model is None:
+                    case = pipeline.attach_ocr_text(case, self.pdf_root_path)
+                    _, request = adapter.render_request(case)
+                else:
+                    _, request = adapter.render_request(case, image_root_path=r"src\data\images")
+            except Exception as case_error:
+                print(f"[❌ ERROR] Case {case.get('case_id')} could not be rendered: {case_error}")
+                continue
+            requests.append((case.get("case_id"), request))
+        return requests
+
+    def _ingest_batch(self, runner, job, model_name, tracking=False):
+        """
+        Wait for a batch job and append its answers to the result files, in the format_result
+        schema. Cases already in a result file (a job ingested again after a crash) are skipped,
+        failed answers go back to the queue like in the other engines.
+        """
+        index = self._benchmark_index()
+        adapter = runner.adapter
+        runner.wait(job)
+        stored = {}  # task -> case ids already in its result file
+        done, failed, duplicate = 0, 0, 0
+        for case_id, body, error in runner.results(job):
+            if case_id not in index.by_id:
+                continue
+            data_name = index.task_of[case_id]
+            if data_name not in stored:
+                stored[data_name] = self._result_store(model_name, data_name).case_ids()
+            if case_id in stored[data_name]:
+                duplicate += 1
+                if tracking:
+                    index.mark_done(model_name, case_id)
+                continue
+            case = index.by_id[case_id]
+            if error is None:
+                try:
+                    predicted_answer, token_count = adapter.parse_completion_body(body)
+                except Exception as parse_error:
+                    error = self.retry_policy.error_of(None, parse_error)
+                else:
+                    pred = adapter.format_result(
+                        test_case=case,
+                        predicted_answer=predicted_answer,
+                        prompt=adapter.format_prompt(case),
+                        response_time=0.0,  # no per-request latency in batch mode
+                        token_count=token_count
+                    )
+                    error = self.retry_policy.error_of(pred)
+            if error is not None:
+                failed += 1
+                print(f"[❌ ERROR] Case {case_id} failed in batch {job['batch_id']}: {error.get('message', error.get('kind'))}")
+                if tracking:
+                    index.release(model_name, case_id)  # pending again for the next run
+                continue
+            pred["batch_id"] = job["batch_id"]
+            self._result_store(model_name, data_name).append(pred)
+            stored[data_name].add(case_id)
+            if tracking:
+                index.mark_done(model_name, case_id)
+            done += 1
+        runner.mark_ingested(job)
+        print(f"📦 Batch {job['batch_id']} ingested: {done} answers, {failed} failed, {duplicate} already stored")
+
+    def _run_batch(self, pipeline, model_name):
+        """
+        Batch engine: render every pending case of every task, submit them as provider
+        batch jobs, poll until they finish and ingest the answers into the result files.
+        Failed cases stay pending for the next run.
+        """
+        runner = BatchJobRunner(pipeline.vlm_model or pipeline.ir_model,
+                                os.path.join(self.batch_path, model_name),
+                                poll_interval=self.batch_poll_interval)
+        # Jobs of an interrupted run first, so their cases are not submitted again
+        for job in runner.unfinished_jobs():
+            self._ingest_batch(runner, job, model_name)
+
+        index = self._start_tracking(model_name)
+        cases = []
+        for data_name in index.tasks:
+            cases.extend(index.next_batch(model_name, data_name, index.remaining(model_name, data_name)))
+        if not cases:
+            return
+
+        for job in runner.submit(self._render_batch_requests(pipeline, cases)):
+            self._ingest_batch(runner, job, model_name, tracking=True)
+
+    def prewarm(self, engines=("pymupdf", "mistral"), max_workers=None, max_concurrency=8):
+        """Fill the shared OCR cache for every PDF the benchmark references before any model runs."""
+        return prewarm(
+            benchmark_folder=self.benchmark_folder,
+            pdf_root_path=self.pdf_root_path,
+            cache=self.ocr_cache,
+            mistral_api_key=self._config.get("mistral_api_key"),
+            engines=engines,
+            max_workers=max_workers,
+            max_concurrency=max_concurrency,
+            pymupdf_layout=self.pymupdf_settings.get("layout", "text"),
+        )
+
+    def prewarm_images(self, model_names=("o1", "models/gemini-2.5-pro-preview-03-25"), max_workers=None):
+        """Encode every page image for the image profiles of model_names before any model runs."""
+        return precompute_image_variants(r"src\data\images", [get_image_profile(name) for name in model_names],
+                                         max_workers=max_workers)
+
+    def retrieval_report(self, output_path="retrieval_report.json"):
+        """Answer-term recall of the retrieval stage versus whole documents, on the pymupdf OCR text."""
+        retriever = self.retriever or PageRetriever()
+        return retrieval_recall_report(self.benchmark_folder, self.pdf_root_path,
+                                       self._pymupdf(), retriever, output_path)
+
+    def compact_results(self):
+        """Fold every append-only result log under save_path into one deduplicated file."""
+        return compact_eval_sets(self.save_path)
+
+    def _run_serial(self, pipeline, model_name):
+        index = self._start_tracking(model_name)
 
         for number in range(self.all_case_number//self.iter_number):
-            for file_name in all_files:
-                data_name = file_name.replace(".json", "")
-                file_path = os.path.join(self.benchmark_folder, file_name)
-
-                with open(file_path, "r", encoding="utf-8") as f:
-                    test_cases = json.load(f)
-
-                already_path = os.path.join(self.save_path, model_name, f"{data_name}.json")
-                already_case_id = set()
-
-                if os.path.exists(already_path):
-                    with open(already_path, "r", encoding="utf-8") as f:
-                        already_case_id = {case.get("case_id") for case in json.load(f)}
-
-                test_cases = [case for case in test_cases if case.get("case_id") not in already_case_id]
-                random.shuffle(test_cases)
-                test_cases=test_cases[:self.iter_number]
+            for data_name in index.tasks:
+                test_cases = self._pending_cases(data_name, model_name)
 
                 if not test_cases:
                     break
 
-                case_iter = iter(test_cases)
-                case = next(case_iter)
-
-                # Basic parameters config
-                process_number = 0  # schedule
-                current_number_errors = 0  # current error number
-                result_path = f"{self.save_path}/{model_name}/{data_name}.json"  # Result file path
-                error_case_path = f"{self.save_path}/{model_name}/{data_name}_error.json"
+                result_store = self._result_store(model_name, data_name)  # Result file
                 progress_bar = tqdm(desc=f"📄 Processing {data_name} with model {model_name}", total=len(test_cases))
 
-                while True:
-                    # break
-                    try:
-                        # continuous error
-                        if current_number_errors > self.error_number:
-                            # append_dict_to_json_file(error_case_path, case)
-                            case = next(case_iter, None)
-                            if case is None:
-                                break
-                            sleep(60)
-                        # model result
-                        pred = pipeline.run(case, r"src\data\raw_pdfs")
-                        if "error" in pred.get("predicted_answer"):
-                            current_number_errors += 1
-                            sleep(20)
-                            continue
-                        else:  # no error
+                for case in test_cases:
+                    for attempt in range(self.retry_policy.max_attempts):
+                        try:
+                            # model result
+                            pred = pipeline.run(case, self.pdf_root_path)
+                            error = self.retry_policy.error_of(pred)
+                        except Exception as case_error:
+                            print(f"[❌ ERROR] Case {case.get('case_id')} failed: {case_error}")
+                            error = self.retry_policy.error_of(None, case_error)
+
+                        if error is None:
                             # save the results
-                            append_dict_to_json_file(result_path, pred)  # append result
-
-                            process_number += 1
+                            result_store.append(pred)  # append result
+                            index.mark_done(model_name, case.get("case_id"))
                             progress_bar.update(1)  # progress bar update
+                            break
+                        if not self.retry_policy.should_retry(error, attempt):
+                            index.release(model_name, case.get("case_id"))  # retry in a later round
+                            print(f"[❌ ERROR] Case {case.get('case_id')} skipped ({error.get('kind')}) after {attempt + 1} attempts")
+                            break
+                        sleep(self.retry_policy.delay(error, attempt))
+
+    def _run_local_batch(self, pipeline, model_name):
+        """
+        Local VLM engine: every round's pending cases of all task files go to the model
+        together, which generates them in micro-batches on its own accelerator.
+        """
+        index = self._start_tracking(model_name)
 
-                            current_number_errors = 0  # Error number resets to zero
-                            case = next(case_iter, None)  # next case
-
-                            if not case:  # case finish
-                                break
-
-                    except Exception as case_error:
-                        current_number_errors += 1  # error add
-                        print(f"[❌ ERROR] Case {process_number} failed: {case_error}")
+        for number in range(self.all_case_number//self.iter_number):
+            pending = []
+            for data_name in index.tasks:
+                pending.extend((data_name, case) for case in self._pending_cases(data_name, model_name))
+            if not pending:
+                break
+
+            progress_bar = tqdm(desc=f"📄 Processing {len(pending)} cases with model {model_name} in batches",
+                                total=len(pending))
+            try:
+                preds = pipeline.run_batch([case for _, case in pending])
+            except Exception as batch_error:
+                print(f"[❌ ERROR] Batched generation failed: {batch_error}")
+                preds = [None] * len(pending)
+
+            for (data_name, case), pred in zip(pending, preds):
+                if pred is not None and self.retry_policy.error_of(pred) is None:
+                    self._result_store(model_name, data_name).append(pred)  # append result
+                    index.mark_done(model_name, case.get("case_id"))
+                    progress_bar.update(1)
+                else:
+                    index.release(model_name, case.get("case_id"))  # retry in a later round
+            progress_bar.close()
+
+    async def _arun_case(self, call, case, model_name, index, result_store, progress_bar, semaphore):
+        """
+        Answer one case of one model with per-case backoff; call() makes a single attempt.
+        A case that keeps failing goes back to the model's queue for a later round.
+        """
+        for attempt in range(self.retry_policy.max_attempts):
+            try:
+                async with semaphore:
+                    pred = await call()
+                error = self.retry_policy.error_of(pred)
+            except Exception as case_error:
+                print(f"[❌ ERROR] Case {case.get('case_id')} failed: {case_error}")
+                error = self.retry_policy.error_of(None, case_error)
+
+            if error is None:
+                # save the results
+                result_store.append(pred)  # append result
+                index.mark_done(model_name, case.get("case_id"))
+                progress_bar.update(1)
+                return
+            if not self.retry_policy.should_retry(error, attempt):
+                break
+            # Only this case backs off; its semaphore slot is free for the others meanwhile
+            await asyncio.sleep(self.retry_policy.delay(error, attempt))
+        index.release(model_name, case.get("case_id"))  # retry in a later round
+        print(f"[❌ ERROR] Case {case.get('case_id')} skipped ({error.get('kind')}) after {attempt + 1} attempts")
+
+    def _question_groups(self, test_cases, model_name, data_name, progress_bar):
+        """
+        Group a round's cases by document, pages and task subcategory, topping every group
+        up to questions_per_request with pending siblings from the task queue.
+        """
+        index = self._benchmark_index()
+        size = self.questions_per_request
+        groups = {}
+        for case in test_cases:
+            groups.setdefault(index.document_key(data_name, case), []).append(case)
+
+        result = []
+        for group in groups.values():
+            for i in range(0, len(group), size):
+                chunk = group[i:i + size]
+                if len(chunk) < size:
+                    siblings = index.take_siblings(model_name, chunk[0].get("case_id"), size - len(chunk))
+                    chunk.extend(siblings)
+                    progress_bar.total += len(siblings)
+                result.append(chunk)
+        return result
+
+    async def _arun_group(self, pipeline, group, model_name, index, result_store, progress_bar, semaphore):
+        """
+        Answer a group of cases on one document with a single request per attempt. Cases
+        whose answer is missing from the response are asked again, alone or with the rest.
+        """
+        # OCR (and retrieval, for every question of the group) once for the whole group
+        shared = copy.deepcopy(group[0])
+        shared["test_case"]["question"] = " ".join(case["test_case"]["question"] for case in group)
+        try:
+            shared = await asyncio.to_thread(pipeline.attach_ocr_text, shared, self.pdf_root_path)
+        except Exception as ocr_error:
+            print(f"[❌ ERROR] OCR of case {group[0].get('case_id')} failed: {ocr_error}")
+            for case in group:
+                index.release(model_name, case.get("case_id"))
+            return
+        for case in group:
+            case_input = case["test_case"]["input"]
+            for field in ("text", "pages", "retrieval"):
+                if field in shared["test_case"]["input"]:
+                    case_input[field] = shared["test_case"]["input"][field]
+
+        pending = list(group)
+        for attempt in range(self.retry_policy.max_attempts):
+            try:
+                async with semaphore:
+                    preds = await pipeline.ir_model.agenerate_answers(pending)
+            except Exception as group_error:
+                print(f"[❌ ERROR] Question group of {pending[0].get('case_id')} failed: {group_error}")
+                preds = [None] * len(pending)
+                errors = [self.retry_policy.error_of(None, group_error)] * len(pending)
+            else:
+                errors = [self.retry_policy.error_of(pred) for pred in preds]
+
+            failed = []
+            for case, pred, error in zip(pending, preds, errors):
+                if error is None:
+                    result_store.append(pred)  # append result
+                    index.mark_done(model_name, case.get("case_id"))
+                    progress_bar.update(1)
+                else:
+                    failed.append((case, error))
+            if not failed:
+                return
+            pending = [case for case, _ in failed]
+            error = failed[0][1]
+            if not self.retry_policy.should_retry(error, attempt):
+                break
+            await asyncio.sleep(self.retry_policy.delay(error, attempt))
+        for case in pending:
+            index.release(model_name, case.get("case_id"))  # retry in a later round
+        print(f"[❌ ERROR] {len(pending)} cases of a question group skipped ({error.get('kind')}) after {attempt + 1} attempts")
+
+    async def _arun(self, pipeline, model_name):
+        """
+        Asyncio engine: every round schedules the pending cases of all task files at once
+        and keeps up to max_concurrency requests of this model in flight.
+        """
+        index = self._start_tracking(model_name)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        grouped = (self.questions_per_request > 1 and pipeline.vlm_model is None
+                   and hasattr(pipeline.ir_model, "agenerate_answers"))
+
+        try:
+            for number in range(self.all_case_number//self.iter_number):
+                jobs = []
+                for data_name in index.tasks:
+                    test_cases = self._pending_cases(data_name, model_name)
+                    if not test_cases:
+                        continue
+
+                    result_store = self._result_store(model_name, data_name)  # Result file
+                    progress_bar = tqdm(desc=f"📄 Processing {data_name} with model {model_name}", total=len(test_cases))
+                    if grouped:
+                        jobs.extend(
+                            self._arun_group(pipeline, group, model_name, index, result_store, progress_bar, semaphore)
+                            for group in self._question_groups(test_cases, model_name, data_name, progress_bar)
+                        )
+                        continue
+                    jobs.extend(
+                        self._arun_case(lambda case=case: pipeline.arun(case, self.pdf_root_path),
+                                        case, model_name, index, result_store, progress_bar, semaphore)
+                        for case in test_cases
+                    )
+
+                if not jobs:
+                    break
+                await asyncio.gather(*jobs)
+        finally:
+            await aclose_http_clients()  # pools of this loop die with it
+
+    async def _afan_out(self, pipeline, model_names):
+        """
+        Fan-out engine: each pending case is OCR'd once and the text goes to every model
+        that has not answered it yet, concurrently, each with its own concurrency limit.
+        """
+        index = None
+        for model_name in model_names:
+            index = self._start_tracking(model_name)
+        semaphores = {model_name: asyncio.Semaphore(self.max_concurrency) for model_name in model_names}
+
+        async def run_case(case, targets, data_name):
+            try:
+                await pipeline.arun_all(
+                    case, self.pdf_root_path, targets,
+                    answer=lambda model_name, call: self._arun_case(
+                        call, case, model_name, index, self._result_store(model_name, data_name),
+                        progress_bars[(model_name, data_name)], semaphores[model_name]))
+            except Exception as case_error:
+                print(f"[❌ ERROR] Fan-out of case {case.get('case_id')} failed: {case_error}")
+                for model_name in targets:
+                    index.release(model_name, case.get("case_id"))  # no-op for models that answered
+
+        try:
+            for number in range(self.all_case_number//self.iter_number):
+                jobs = []
+                progress_bars = {}
+                for data_name in index.tasks:
+                    cases, targets = {}, {}
+                    for model_name in model_names:
+                        test_cases = self._pending_cases(data_name, model_name)
+                        if test_cases:
+                            progress_bars[(model_name, data_name)] = tqdm(
+                                desc=f"📄 Processing {data_name} with model {model_name}", total=len(test_cases))
+                        for case in test_cases:
+                            cases.setdefault(case.get("case_id"), case)
+                            targets.setdefault(case.get("case_id"), []).append(model_name)
+                    jobs.extend(run_case(case, targets[case_id], data_name) for case_id, case in cases.items())
+
+                if not jobs:
+                    break
+                await asyncio.gather(*jobs)
+        finally:
+            await aclose_http_clients()
+
+    def fan_out(self, ocr_engine="pymupdf", model_names=None):
+        """
+        Run several IR models on one OCR pass. model_names are result folder names of the
+        mupdf_* (ocr_engine "pymupdf") or mis_* (ocr_engine "mistral") pipelines, default all.
+        """
+        available = self._ir_models(ocr_engine)
+        model_names = list(model_names or available)
+        if ocr_engine == "mistral":
+            ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
+        else:
+            ocr_model = self._pymupdf()
+        pipeline = FanOutPipeline(ocr_model, {name: available[name]() for name in model_names},
+                                  retriever=self.retriever)
+        self._configure_adapters(pipeline.ir_models.values())
+        try:
+            asyncio.run(self._afan_out(pipeline, model_names))
+        finally:
+            for model_name in model_names:
+                self._close_result_stores(model_name)
+
+    def _ir_models(self, ocr_engine):
+        """Result folder name -> IR adapter factory, as used by the single-model pipeline methods."""
+        if ocr_engine == "mistral":
+            return {
+                "mistral_llava_local": lambda: LlavaModel(api_key=self._config["aliyun_api_key"]),
+                "mistral_qwen_api": lambda: QWenModel(api_key=self._config["aliyun_api_key"]),
+                "mis_gpt40_mini": lambda: GPT4OMINIModel(api_key=self._config["openai_api_key"]),
+                "misThudmGlm": lambda: ThudmGLMModel(api_key=self._config['deepseek_r1_api_key']),
+                "mis_hunyuan": lambda: HunYuanModel(api_key=self._config['hunyuan_api_key']),
+                "mis_qwen_coder": lambda: QWenCoderModel(api_key=self._config['aliyun_api_key']),
+            }
+        return {
+            "mupdf_llava_local": lambda: LlavaModel(api_key=self._config['aliyun_api_key']),
+            "mupdf_qwen_api": lambda: QWenModel(api_key=self._config["aliyun_api_key"]),
+            "mupdf_gpt4o_mini": lambda: GPT4OMINIModel(api_key=self._config["openai_api_key"]),
+            "qwen_max": lambda: QwenMax(api_key=self._config["aliyun_api_key"]),
+            "mupdfThudmGlm": lambda: ThudmGLMModel(api_key=self._config['deepseek_r1_api_key']),
+            "mupdf_hunyuan": lambda: HunYuanModel(api_key=self._config['hunyuan_api_key']),
+            "mupdf_qwen_coder": lambda: QWenCoderModel(api_key=self._config['aliyun_api_key']),
+        }
 
     def mistral_llava_local(self):
-        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"])
+        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
         ir_model = LlavaModel(api_key=self._config["aliyun_api_key"])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mistral_llava_local")
 
     def mupdf_llava_local(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = LlavaModel(api_key=self._config['aliyun_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mupdf_llava_local")
 
     def mistral_qwen_api(self):
-        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"])
+        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
         ir_model = QWenModel(api_key=self._config["aliyun_api_key"])  # Completed
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mistral_qwen_api")
 
     def mupdf_qwen_api(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = QWenModel(api_key=self._config["aliyun_api_key"])  # Completed
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mupdf_qwen_api")
@@ -241,13 +709,13 @@ class ManageModel:
         self._run(pipeline, "deepseek_vlm_local")
 
     def mis_gpt40_mini(self):
-        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"])
+        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
         ir_model = GPT4OMINIModel(api_key=self._config["openai_api_key"])  # Completed
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mis_gpt40_mini")
 
     def mupdf_gpt4o_mini(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = GPT4OMINIModel(api_key=self._config["openai_api_key"])  # Completed
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mupdf_gpt4o_mini")
@@ -258,43 +726,43 @@ class ManageModel:
         self._run(pipeline, "gemini")
 
     def qwen_max(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = QwenMax(api_key=self._config["aliyun_api_key"])  # Completed
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "qwen_max")
 
     def mis_glm(self):
-        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"])
+        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
         ir_model = ThudmGLMModel(api_key=self._config['deepseek_r1_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "misThudmGlm")
 
     def mupdf_glm(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = ThudmGLMModel(api_key=self._config['deepseek_r1_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mupdfThudmGlm")
 
     def mis_hunyuan(self):
-        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"])
+        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
         ir_model = HunYuanModel(api_key=self._config['hunyuan_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mis_hunyuan")
 
     def mupdf_hunyuan(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = HunYuanModel(api_key=self._config['hunyuan_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mupdf_hunyuan")
 
     def mis_qwen_coder(self):
-        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"])
+        ocr_model = ExtractTextByMistral(self._config["mistral_api_key"], cache=self.ocr_cache)
         ir_model = QWenCoderModel(api_key=self._config['aliyun_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mis_qwen_coder")
 
     def mupdf_qwen_coder(self):
-        ocr_model = ExtractTextByPyMuPDF()
+        ocr_model = self._pymupdf()
         ir_model = QWenCoderModel(api_key=self._config['aliyun_api_key'])
         pipeline = Pipeline(ocr_model, ir_model)
         self._run(pipeline, "mupdf_qwen_coder")